@@ -0,0 +1,193 @@
+"""
+Throughput benchmarks of the simulation engines, for every thermostat type.
+
+Measures months per second and ticks per second of single-month runs (scalar engine), multi-month runs
+(scalar and batch engine) and comparison runs (two thermostats with the batch engine) at several sizes.
+Every case uses a fixed seed, is warmed up first and timed over several trials.
+
+    python bench.py --output bench_results.json
+    python bench.py --baseline bench_results.json # Flags cases that got slower than the baseline
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+import cooler_instance as ci
+import door_events
+import parallel
+import physics
+import price_store
+import thermostat as therm
+
+SEED = 12345
+REFERENCE_THERMOSTAT = "SIMPLE" # The second thermostat of comparison runs
+
+class BenchmarkCase():
+    """
+    A single thing to time: a mode, an engine and a size, for a thermostat type
+    """
+    def __init__(self, thermostat_type: str, mode: str, engine: str, months: int):
+        self.thermostat_type = thermostat_type
+        self.mode = mode # "single", "multi" or "comparison"
+        self.engine = engine # "scalar" or "batch"
+        self.months = months
+
+    @property
+    def name(self) -> str:
+        return f"{self.thermostat_type}/{self.mode}/{self.engine}/{self.months}"
+
+    @property
+    def room_count(self) -> int:
+        """
+        The amount of rooms simulated per month. A comparison run simulates two.
+        """
+        return 2 if self.mode == "comparison" else 1
+
+    def run(self, power_prices: np.ndarray, cooler_options: dict, workers: int = 1):
+        """
+        Runs the case once
+        """
+        thermostat = therm.ThermostatType[self.thermostat_type].value()
+        if self.engine == "scalar":
+            cooler = ci.CoolerInstance(thermostat, power_prices, cooler_options["door_model"], np.random.default_rng(SEED), record_history=False,
+                                       tick_seconds=cooler_options["tick_seconds"], physical_constants=cooler_options["physical_constants"])
+            for _ in range(self.months):
+                cooler.simulate_month(False)
+            return
+        thermostats = [thermostat]
+        if self.mode == "comparison":
+            thermostats.append(therm.ThermostatType[REFERENCE_THERMOSTAT].value())
+        parallel.simulate_multiple_months_parallel(thermostats, power_prices, self.months, workers, SEED, cooler_options=cooler_options)
+
+def benchmark_cases(thermostat_types: list, scalar_sizes: list, batch_sizes: list, comparison_sizes: list) -> list:
+    """
+    The cases to run for every thermostat type
+
+    >>> [case.name for case in benchmark_cases(["SIMPLE"], [10], [100], [100])]
+    ['SIMPLE/single/scalar/1', 'SIMPLE/multi/scalar/10', 'SIMPLE/multi/batch/100', 'SIMPLE/comparison/batch/100']
+    """
+    cases = []
+    for thermostat_type in thermostat_types:
+        cases.append(BenchmarkCase(thermostat_type, "single", "scalar", 1))
+        cases += [BenchmarkCase(thermostat_type, "multi", "scalar", months) for months in scalar_sizes]
+        cases += [BenchmarkCase(thermostat_type, "multi", "batch", months) for months in batch_sizes]
+        cases += [BenchmarkCase(thermostat_type, "comparison", "batch", months) for months in comparison_sizes]
+    return cases
+
+def time_case(case: BenchmarkCase, power_prices: np.ndarray, cooler_options: dict, trials: int = 5, warmup: int = 1, workers: int = 1) -> dict:
+    """
+    Times a case and returns its result. Throughput is based on the median trial.
+    """
+    for _ in range(warmup):
+        case.run(power_prices, cooler_options, workers)
+    durations = []
+    for _ in range(trials):
+        start_time = time.perf_counter()
+        case.run(power_prices, cooler_options, workers)
+        durations.append(time.perf_counter() - start_time)
+
+    median_seconds = float(np.median(durations))
+    simulated_months = case.months * case.room_count
+    return {
+        "name": case.name,
+        "thermostat_type": case.thermostat_type,
+        "mode": case.mode,
+        "engine": case.engine,
+        "months": case.months,
+        "rooms": case.room_count,
+        "ticks": simulated_months * len(power_prices),
+        "trial_seconds": durations,
+        "median_seconds": median_seconds,
+        "min_seconds": float(np.min(durations)),
+        "months_per_second": simulated_months / median_seconds,
+        "ticks_per_second": simulated_months * len(power_prices) / median_seconds,
+    }
+
+def run_benchmarks(cases: list, power_prices: np.ndarray, cooler_options: dict, trials: int = 5, warmup: int = 1, workers: int = 1) -> dict:
+    """
+    Times every case and returns the report, with a description of the machine
+    """
+    results = []
+    for case in cases:
+        result = time_case(case, power_prices, cooler_options, trials, warmup, workers)
+        print(f"{case.name:<45} {result['months_per_second']:>12.1f} months/s {result['ticks_per_second']:>14.0f} ticks/s")
+        results.append(result)
+    return {
+        "machine": {"platform": platform.platform(), "processor": platform.processor(), "python": platform.python_version(), "numpy": np.__version__},
+        "settings": {"seed": SEED, "trials": trials, "warmup": warmup, "workers": workers, "ticks_per_month": len(power_prices)},
+        "results": results,
+    }
+
+def compare_to_baseline(report: dict, baseline: dict, tolerance: float = 0.1) -> list:
+    """
+    Compares the throughput of every case to the baseline. A case regressed if it is more than tolerance slower.
+    Returns (name, baseline months/s, months/s, ratio, regressed) rows. Cases missing from the baseline are left out.
+
+    >>> baseline = {"results": [{"name": "a", "months_per_second": 100.0}, {"name": "b", "months_per_second": 100.0}]}
+    >>> report = {"results": [{"name": "a", "months_per_second": 80.0}, {"name": "b", "months_per_second": 95.0}]}
+    >>> [(name, regressed) for name, _, _, _, regressed in compare_to_baseline(report, baseline)]
+    [('a', True), ('b', False)]
+    """
+    baseline_results = {result["name"]: result for result in baseline["results"]}
+    rows = []
+    for result in report["results"]:
+        if result["name"] not in baseline_results:
+            continue
+        baseline_throughput = baseline_results[result["name"]]["months_per_second"]
+        ratio = result["months_per_second"] / baseline_throughput
+        rows.append((result["name"], baseline_throughput, result["months_per_second"], ratio, ratio < 1 - tolerance))
+    return rows
+
+def load_benchmark_prices(path: str = "elpris.csv") -> tuple:
+    """
+    The power prices and tick length to benchmark with. The last row is left out, like in the simulation.
+    """
+    store = price_store.PriceStore.open(path)
+    return np.asarray(store.prices[:-1]), store.tick_seconds()
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Throughput benchmarks of the simulation engines")
+    parser.add_argument("--prices", default="elpris.csv", help="CSV with the power prices")
+    parser.add_argument("--thermostats", nargs="+", default=[member.name for member in therm.ThermostatType], help="Thermostat types to benchmark")
+    parser.add_argument("--scalar-sizes", nargs="*", type=int, default=[10], help="Month counts of multi-month runs with the scalar engine")
+    parser.add_argument("--batch-sizes", nargs="*", type=int, default=[10, 100, 1000], help="Month counts of multi-month runs with the batch engine")
+    parser.add_argument("--comparison-sizes", nargs="*", type=int, default=[100, 1000], help="Month counts of comparison runs")
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", help="Path to write the results to, as json")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare to")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="How much slower than the baseline a case may be, as a fraction")
+    args = parser.parse_args(argv)
+
+    for thermostat_type in args.thermostats:
+        if thermostat_type not in therm.ThermostatType.__members__:
+            raise ValueError(f"Invalid ThermostatType: {thermostat_type}")
+
+    power_prices, tick_seconds = load_benchmark_prices(args.prices)
+    cooler_options = {"door_model": door_events.BernoulliDoorModel(), "tick_seconds": tick_seconds, "physical_constants": physics.PhysicalConstants()}
+    cases = benchmark_cases(args.thermostats, args.scalar_sizes, args.batch_sizes, args.comparison_sizes)
+    report = run_benchmarks(cases, power_prices, cooler_options, args.trials, args.warmup, args.workers)
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline is None:
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as file:
+        baseline = json.load(file)
+    rows = compare_to_baseline(report, baseline, args.tolerance)
+    print(f"\n{'Case':<45} {'Baseline':>12} {'Now':>12} {'Ratio':>7}")
+    for name, baseline_throughput, throughput, ratio, regressed in rows:
+        print(f"{name:<45} {baseline_throughput:>12.1f} {throughput:>12.1f} {ratio:>7.2f}{'  REGRESSION' if regressed else ''}")
+    regression_count = sum(row[4] for row in rows)
+    print(f"{regression_count} of {len(rows)} cases are more than {round(args.tolerance * 100)}% slower than the baseline")
+    return 1 if regression_count else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Compares two thermostats with common random numbers: both see the same door events every month,
+so the difference in cost between them is only caused by the thermostats.
+The batch engine pairs the months of any comparison this way, a paired comparison adds early stopping:
+months are simulated in rounds until the confidence interval of the mean difference is narrow enough.
+"""
+from statistics import NormalDist
+import os
+
+import numpy as np
+
+import parallel
+
+class PairedComparisonResult():
+    """
+    The outcome of a paired comparison. A positive mean difference means the first thermostat is more expensive.
+    """
+    def __init__(self, first_expenses: np.ndarray, second_expenses: np.ndarray, confidence_level: float, target_width: float, period_differences: np.ndarray = None):
+        self.first_expenses = first_expenses # Total expenses per month
+        self.second_expenses = second_expenses
+        self.period_differences = period_differences # The mean difference of every period, if the months were simulated per period
+        self.confidence_level = confidence_level
+        self.target_width = target_width
+
+        differences = first_expenses - second_expenses
+        self.months = len(differences)
+        self.mean_difference = float(np.mean(differences))
+        self.half_width = confidence_half_width(differences, confidence_level)
+        self.lower = self.mean_difference - self.half_width
+        self.upper = self.mean_difference + self.half_width
+
+    @property
+    def converged(self) -> bool:
+        """
+        Whether the confidence interval reached the target width
+        """
+        return 2 * self.half_width <= self.target_width
+
+    def __str__(self) -> str:
+        return (f"Mean difference: {self.mean_difference:.2f} kr. per month, "
+                f"{round(self.confidence_level * 100)}% confidence interval [{self.lower:.2f}, {self.upper:.2f}] after {self.months} months")
+
+def confidence_half_width(differences: np.ndarray, confidence_level: float) -> float:
+    """
+    Half the width of the normal-approximation confidence interval of the mean
+
+    >>> round(confidence_half_width(np.array([1.0, 3.0, 1.0, 3.0]), 0.95), 3)
+    1.132
+    """
+    if len(differences) < 2:
+        return float("inf")
+    z_value = NormalDist().inv_cdf(0.5 + confidence_level / 2)
+    return float(z_value * np.std(differences, ddof=1) / np.sqrt(len(differences)))
+
+def paired_comparison(first_thermostat, second_thermostat, power_prices: np.ndarray, max_months: int, target_width: float, confidence_level: float = 0.95,
+                      min_months: int = 100, batch_size: int = 1000, workers: int = 1, seed: int = None, cooler_options: dict = None,
+                      price_scenarios=None, period_starts: np.ndarray = None) -> PairedComparisonResult:
+    """
+    Simulates both thermostats with the same door events, one round of blocks at a time, and stops when the
+    confidence interval of the mean cost difference is at most target_width wide, or after max_months months.
+    A round is one block of batch_size months per worker. With price_scenarios both thermostats see the same synthetic prices.
+    With period_starts, the result also has the mean difference of every period.
+
+    >>> import thermostat as therm
+    >>> paired_comparison(therm.SimpleThermostat(), therm.SimpleThermostat(), np.ones(10), 0, 10.0)
+    Traceback (most recent call last):
+    ...
+    ValueError: A paired comparison needs at least one month, max_months is 0
+    """
+    if max_months < 1:
+        raise ValueError(f"A paired comparison needs at least one month, max_months is {max_months}")
+    if seed is None:
+        seed = np.random.SeedSequence().entropy # Both thermostats and all rounds must share the seed
+    if workers is None:
+        workers = os.cpu_count()
+    round_months = batch_size * max(1, workers)
+    first_expenses = np.zeros(0)
+    second_expenses = np.zeros(0)
+    first_block = 0
+    period_difference_totals = 0.0
+
+    with parallel.SimulationPool(power_prices, workers) as pool: # Started once, and reused by every round
+        while len(first_expenses) < max_months:
+            month_count = min(round_months, max_months - len(first_expenses))
+            first_values, second_values = pool.simulate([first_thermostat, second_thermostat], month_count, seed, batch_size, cooler_options, first_block,
+                                                         price_scenarios, period_starts)
+            first_totals = first_values[0] + first_values[1]
+            second_totals = second_values[0] + second_values[1]
+            if period_starts is not None:
+                period_difference_totals = period_difference_totals + np.sum(first_totals - second_totals, axis=0)
+                first_totals = np.sum(first_totals, axis=1)
+                second_totals = np.sum(second_totals, axis=1)
+            first_expenses = np.concatenate([first_expenses, first_totals])
+            second_expenses = np.concatenate([second_expenses, second_totals])
+            first_block += -(-month_count // batch_size) # The blocks used by this round
+
+            period_differences = period_difference_totals / len(first_expenses) if period_starts is not None else None
+            result = PairedComparisonResult(first_expenses, second_expenses, confidence_level, target_width, period_differences)
+            if result.months >= min_months and result.converged:
+                break
+
+    return result
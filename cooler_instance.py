@@ -1,108 +1,479 @@
 """
 Defines classes that handle logic related to simulating temperature changes in the cooler.
 """
-import random
-import math
+import copy
+from types import SimpleNamespace
 
 import numpy as np
 
 import thermostat as therm
+import door_events
+import physics
+
+DOOR_CHUNK_TICKS = 720 # The batch engine draws the door states of this many ticks at once, to bound memory
+EXPENSE_BUFFER_TICKS = 720 # Without history, CoolerInstance settles its expenses every this many ticks
+RATE_TICK_SECONDS = 300 # The food loss rates and the power use of the compressor are given per 5 minutes
+
+def expense_scale(tick_seconds: int) -> float:
+    """
+    How many 5 minute periods a tick covers, the factor the per-5-minute expenses are multiplied by
+
+    >>> expense_scale(3600)
+    12.0
+
+    A month with a closed door costs about the same with 5 minute and with hourly ticks:
+
+    >>> def month_expenses(tick_seconds):
+    ...     tick_count = 30 * 86400 // tick_seconds
+    ...     cooler = CoolerInstance(therm.SimpleThermostat(), np.ones(tick_count), door_events.BernoulliDoorModel(0.0), record_history=False, tick_seconds=tick_seconds)
+    ...     return cooler.simulate_month(False)
+    >>> month_expenses(300), month_expenses(3600)
+    ((0.0, 811.0), (0.0, 816.0))
+    """
+    return tick_seconds / RATE_TICK_SECONDS
+
+def expenses_per_period(expenses: np.ndarray, period_starts: np.ndarray) -> np.ndarray:
+    """
+    Sums per-tick expenses (last axis) per period, given the first tick of every period
+
+    >>> expenses_per_period(np.array([1.0, 2.0, 3.0, 4.0]), np.array([0, 1]))
+    array([1., 9.])
+    """
+    return np.add.reduceat(expenses, period_starts, axis=-1)
 
 class CoolerInstance():
     """
-    Class that represents the cooler room
+    Class that represents the cooler room.
+    The room is simulated for as many ticks as there are power prices, each tick_seconds long.
+    With record_history=False no per-tick histories are allocated, and only the month totals are kept.
+
+    Only the temperature is computed tick by tick. The temperatures and compressor states are kept in a buffer,
+    and the food loss and power expenses are computed from it with array operations when it is full.
     """
-    def __init__(self, thermostat_instance: therm.Thermostat, power_prices):
+    def __init__(self, thermostat_instance: therm.Thermostat, power_prices, door_model: door_events.DoorModel = None, rng: np.random.Generator = None,
+                 record_history: bool = True, tick_seconds: int = 300, physical_constants: physics.PhysicalConstants = None):
         self.tick_counter = 1
 
         self.thermostat_instance = thermostat_instance
+        self.door_model = door_model if door_model is not None else door_events.BernoulliDoorModel()
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.tick_count = len(power_prices)
+        self.tick_seconds = tick_seconds
+        self.physical_constants = physical_constants if physical_constants is not None else physics.PhysicalConstants()
+        # Plain lists, indexing them with Python numbers is faster than indexing numpy arrays one value at a time
+        slopes, offsets = self.physical_constants.transition_table(tick_seconds)
+        self.temperature_slopes, self.temperature_offsets = slopes.tolist(), offsets.tolist()
+        self.door_states = [False] * self.tick_count # Drawn for the whole month at the start of simulate_month
 
-        self.compressor_state_history = np.zeros(8640, dtype=bool)
-        self.door_state_history = np.zeros(8640, dtype=bool)
+        self.record_history = record_history
         self.current_temperature = 5.0
 
         self.power_prices = power_prices
 
-        self.temperature_history = np.zeros(8640)
-        #self.temperature_history[0] = self.current_temperature
+        if record_history:
+            self.compressor_state_history = np.zeros(self.tick_count, dtype=bool)
+            self.door_state_history = np.zeros(self.tick_count, dtype=bool)
+            self.temperature_history = np.zeros(self.tick_count)
+            #self.temperature_history[0] = self.current_temperature
+
+            self.food_loss_expenses = np.zeros(self.tick_count)
+            self.power_expenses = np.zeros(self.tick_count)
+
+            # The buffer is the whole history, so the expenses are computed once at the end of the month
+            self.temperature_buffer = self.temperature_history
+            self.compressor_buffer = self.compressor_state_history
+        else:
+            self.temperature_buffer = np.zeros(min(self.tick_count, EXPENSE_BUFFER_TICKS))
+            self.compressor_buffer = np.zeros(min(self.tick_count, EXPENSE_BUFFER_TICKS), dtype=bool)
+        self.buffer_start = 0 # The tick of the first value in the buffers
+
+        # Running totals of the month
+        self.food_loss_total = 0.0
+        self.power_total = 0.0
 
-        self.food_loss_expenses = np.zeros(8640)
-        self.power_expenses = np.zeros(8640)
+        self.temperature_thresholds = None
+        thermostat_instance.attach_room(self)
 
     def is_door_open(self) -> bool:
         """
-        Checks if the door is open, returns true 10% of the time
+        Checks if the door is open at the current tick, as drawn by the door model
         """
-        if random.randint(0, 99) < 10:
-            return True
-        else:
-            return False
+        return self.door_states[self.tick_counter]
 
     def simulate_month(self, include_all_data: bool) -> float:
         """
-        Simulates the coolerroom for a month, returns the total expenses
+        Simulates the coolerroom for a month (or whatever horizon the power prices cover), returns the total expenses
         """
-        self.temperature_history[0] = 5.0
+        self.start_month()
+        self.run_until(self.tick_count)
+        return self.finish_month(include_all_data)
+
+    def start_month(self):
+        """
+        Puts the room at tick 0 with no expenses, and draws the door states of the month
+        """
+        self.food_loss_total = 0.0
+        self.power_total = 0.0
+        self.buffer_start = 0
+        if self.record_history:
+            self.temperature_buffer = self.temperature_history
+            self.compressor_buffer = self.compressor_state_history
+        self.compile_thresholds()
+        self.door_states = self.door_model.draw(self.rng, 1, self.tick_count)[0].tolist() # The door states of the whole month at once
 
         self.tick_counter = 0
 
-        while self.tick_counter < 8640:
+    def compile_thresholds(self):
+        """
+        Asks the thermostat for its temperature cutoffs, see Thermostat.compile_thresholds
+        """
+        temperature_thresholds = self.thermostat_instance.compile_thresholds(self.power_prices)
+        self.temperature_thresholds = None if temperature_thresholds is None else temperature_thresholds.tolist()
+
+    def run_until(self, end_tick: int):
+        """
+        Advances the room until end_tick, continuing from the current state
+        """
+        while self.tick_counter < end_tick:
             self.simulate_tick(self.tick_counter)
             self.tick_counter += 1
-        
+
+    def finish_month(self, include_all_data: bool) -> tuple:
+        """
+        Settles the expenses of the simulated ticks and returns them, see simulate_month
+        """
+        if include_all_data and not self.record_history:
+            raise ValueError("include_all_data needs a CoolerInstance with record_history=True")
+        self.settle_expenses(self.tick_counter - self.buffer_start) # Whatever is left in the buffer
+
         if include_all_data:
             return (self.food_loss_expenses, self.power_expenses, self.temperature_history, self.door_state_history, self.compressor_state_history)
         else:
-            return (np.sum(self.food_loss_expenses), np.sum(self.power_expenses))
+            return (self.food_loss_total, self.power_total)
+
+    def simulate_periods(self, period_starts: np.ndarray) -> tuple:
+        """
+        Simulates the whole horizon, returns the food loss and power expenses per period, like BatchCoolerInstance.simulate_periods.
+        Gives the same totals as simulate_month.
+
+        >>> cooler = CoolerInstance(therm.SimpleThermostat(), np.ones(100), rng=np.random.default_rng(1), record_history=False)
+        >>> food, power = cooler.simulate_periods(np.array([0, 50]))
+        >>> float(power.sum()) == CoolerInstance(therm.SimpleThermostat(), np.ones(100), rng=np.random.default_rng(1), record_history=False).simulate_month(False)[1]
+        True
+        """
+        self.start_month()
+        period_ends = list(period_starts[1:]) + [self.tick_count]
+        food_loss_expenses = np.zeros(len(period_ends))
+        power_expenses = np.zeros(len(period_ends))
+
+        for period_index, period_end in enumerate(period_ends):
+            food_loss_before = self.food_loss_total
+            power_before = self.power_total
+            self.run_until(period_end)
+            self.settle_expenses(self.tick_counter - self.buffer_start)
+            food_loss_expenses[period_index] = self.food_loss_total - food_loss_before
+            power_expenses[period_index] = self.power_total - power_before
+
+        return (food_loss_expenses, power_expenses)
+
+    def snapshot(self) -> "CoolerSnapshot":
+        """
+        Captures the state of the room between two ticks of a month, see CoolerSnapshot
+        """
+        self.settle_expenses(self.tick_counter - self.buffer_start) # So the snapshot only needs the totals
+        return CoolerSnapshot(self)
+
+    def restore(self, snapshot: "CoolerSnapshot", thermostat_instance: therm.Thermostat = None):
+        """
+        Puts the room in the state of the snapshot, with a copy of the snapshot's thermostat,
+        or with thermostat_instance to continue with another thermostat
+        """
+        if snapshot.tick_count != self.tick_count:
+            raise ValueError("The snapshot is of a room with a different amount of ticks")
+        self.thermostat_instance = thermostat_instance if thermostat_instance is not None else copy.deepcopy(snapshot.thermostat_instance)
+        self.thermostat_instance.attach_room(self)
+        self.compile_thresholds()
+
+        self.tick_counter = snapshot.tick_counter
+        self.current_temperature = snapshot.current_temperature
+        self.food_loss_total = snapshot.food_loss_total
+        self.power_total = snapshot.power_total
+        self.door_states = np.unpackbits(snapshot.door_states, count=self.tick_count).astype(bool).tolist()
+        self.rng.bit_generator.state = snapshot.rng_state
+
+        self.buffer_start = snapshot.tick_counter
+        if self.record_history:
+            if snapshot.histories is None:
+                raise ValueError("A room with record_history=True needs a snapshot of a room that records history")
+            for name, history in snapshot.histories.items():
+                getattr(self, name)[:snapshot.tick_counter] = history
+            self.temperature_buffer = self.temperature_history[self.buffer_start:]
+            self.compressor_buffer = self.compressor_state_history[self.buffer_start:]
+
+    def fork(self, snapshot: "CoolerSnapshot" = None, thermostat_instance: therm.Thermostat = None) -> "CoolerInstance":
+        """
+        A new room in the state of the snapshot (by default the current state of this room), optionally with another thermostat.
+        It has its own copy of the random stream, so it sees the same door events as this room would.
+        """
+        if snapshot is None:
+            snapshot = self.snapshot()
+        branch = CoolerInstance(thermostat_instance if thermostat_instance is not None else copy.deepcopy(snapshot.thermostat_instance), self.power_prices,
+                                self.door_model, copy.deepcopy(self.rng), self.record_history, self.tick_seconds, self.physical_constants)
+        branch.restore(snapshot, branch.thermostat_instance)
+        return branch
 
     def simulate_tick(self, count) -> tuple:
         """
-        Logic for a 5 minute interval. 
+        Logic for a 5 minute interval (or tick_seconds). 
         Calculates the current temperature, based on whether 
         the door is open and whether the compressor is on.
         """
         if count == 0:
             last_temp = 5
         else:
-            last_temp = self.temperature_history[count-1] # Get the last temperature
+            last_temp = self.current_temperature # Get the last temperature
 
         door_open = self.is_door_open() # Randomly decide if the door is open
-        comp_on = self.thermostat_instance.evaluate_cooler_state(self) # Evaluate whether the cooler should be on
-
-        # Decision tree looks like this for the sake of speed
-        # C1 and C2's values could simply be changed by the above functions,
-        # but on the scale of 1000s of simulations, it could make a difference.
-        if door_open and comp_on: # If both the door is open, and the compressor is on
-            t = last_temp + (0.00003 * (20-last_temp) + 0.000008 * (-5 - last_temp)) * 300 # Calculate the temperature as this
-            self.door_state_history[count] = True # Add this to the history
-            self.compressor_state_history[count] = True # And this
-            self.power_expenses[count] = self.power_prices[count] # Add the price of power at this moment to the history of prices
-        elif door_open:
-            t = last_temp + (0.00003 * (20-last_temp)) * 300
-            self.power_expenses[count] = 0.0
-            self.door_state_history[count] = True
-            self.compressor_state_history[count] = False
-        elif comp_on:
-            t = last_temp + (0.0000005 * (20-last_temp) + 0.000008 * (-5 - last_temp)) * 300
-            self.power_expenses[count] = self.power_prices[count]
-            self.compressor_state_history[count] = True
-            self.door_state_history[count] = False
+        if self.temperature_thresholds is not None:
+            comp_on = self.current_temperature > self.temperature_thresholds[count] # Compiled thermostat, same answer as evaluate_cooler_state
         else:
-            t = last_temp + (0.0000005 * (20-last_temp)) * 300
-            self.power_expenses[count] = 0.0
+            comp_on = self.thermostat_instance.evaluate_cooler_state(self) # Evaluate whether the cooler should be on
+
+        # The four (door, compressor) combinations are affine maps of the last temperature, looked up in a table
+        transition = 2 * door_open + comp_on
+        t = self.temperature_slopes[transition] * last_temp + self.temperature_offsets[transition]
 
-        self.temperature_history[count] = t # Add the temperature to the temperature history
         self.current_temperature = t # Set the current temperature to the new calculated temperature
 
-        self.food_loss_expenses[count] = self.calculate_food_loss_expense(t) # Calculate and add the price of food loss for this tick
+        buffer_index = count - self.buffer_start
+        self.temperature_buffer[buffer_index] = t
+        self.compressor_buffer[buffer_index] = comp_on
+        if self.record_history:
+            self.door_state_history[count] = door_open
+
+        if buffer_index == len(self.temperature_buffer) - 1:
+            self.settle_expenses(buffer_index + 1)
+
+    def settle_expenses(self, tick_count: int):
+        """
+        Computes the food loss and power expenses of the first tick_count ticks in the buffer
+        as array operations, adds them to the totals and empties the buffer
+        """
+        if tick_count <= 0:
+            return
+        start = self.buffer_start
+        food_loss_expenses = calculate_food_loss_expenses(self.temperature_buffer[:tick_count], self.tick_seconds)
+        power_expenses = np.where(self.compressor_buffer[:tick_count], self.power_prices[start:start + tick_count] * expense_scale(self.tick_seconds), 0.0)
+
+        self.food_loss_total += float(np.sum(food_loss_expenses))
+        self.power_total += float(np.sum(power_expenses))
+        self.buffer_start += tick_count
+        if self.record_history:
+            self.food_loss_expenses[start:start + tick_count] = food_loss_expenses
+            self.power_expenses[start:start + tick_count] = power_expenses
+            # The buffer is the rest of the history
+            self.temperature_buffer = self.temperature_history[self.buffer_start:]
+            self.compressor_buffer = self.compressor_state_history[self.buffer_start:]
+
+class CoolerSnapshot():
+    """
+    The state of a CoolerInstance between two ticks: the tick, temperature, expense totals, a copy of the thermostat,
+    the door states of the month (as bits) and the state of the random stream. Per-tick histories up to the tick
+    are only kept for rooms that record them.
+    """
+    def __init__(self, cooler: CoolerInstance):
+        self.tick_count = cooler.tick_count
+        self.tick_counter = cooler.tick_counter
+        self.current_temperature = cooler.current_temperature
+        self.food_loss_total = cooler.food_loss_total
+        self.power_total = cooler.power_total
+        self.thermostat_instance = copy.deepcopy(cooler.thermostat_instance) # Leaves out cached price features, see Thermostat.__getstate__
+        self.door_states = np.packbits(np.asarray(cooler.door_states, dtype=bool))
+        self.rng_state = copy.deepcopy(cooler.rng.bit_generator.state)
+
+        self.histories = None
+        if cooler.record_history:
+            names = ["temperature_history", "door_state_history", "compressor_state_history", "food_loss_expenses", "power_expenses"]
+            self.histories = {name: getattr(cooler, name)[:cooler.tick_counter].copy() for name in names}
+
+def simulate_branches(cooler: CoolerInstance, branch_tick: int, thermostats: list) -> list:
+    """
+    Simulates a month with the room's thermostat until branch_tick, then finishes it once with every thermostat in
+    thermostats, all continuing from the same state and seeing the same door events. Returns (food, power) per thermostat.
+
+    >>> prices = np.ones(100)
+    >>> cooler = CoolerInstance(therm.SimpleThermostat(), prices, rng=np.random.default_rng(1), record_history=False)
+    >>> branches = simulate_branches(cooler, 40, [therm.SimpleThermostat()])
+    >>> branches[0] == CoolerInstance(therm.SimpleThermostat(), prices, rng=np.random.default_rng(1), record_history=False).simulate_month(False)
+    True
+    """
+    cooler.start_month()
+    cooler.run_until(branch_tick)
+    snapshot = cooler.snapshot()
+    results = []
+    for thermostat_instance in thermostats:
+        branch = cooler.fork(snapshot, thermostat_instance)
+        branch.run_until(branch.tick_count)
+        results.append(branch.finish_month(False))
+    return results
+
+def calculate_food_loss_expenses(temperatures: np.ndarray, tick_seconds: int = 300) -> np.ndarray:
+    """
+    Calculates the expense of food loss in a tick of tick_seconds, at each of the temperatures.
+    The rates are per 5 minutes: cold food is lost below 3.5 degrees, warm food above 6.5 degrees.
+
+    >>> calculate_food_loss_expenses(np.array([5.0, 7.0])).round(3)
+    array([0.   , 0.963])
+    >>> calculate_food_loss_expenses(np.array([5.0, 7.0]), 3600).round(3)
+    array([ 0.   , 11.561])
+    """
+    temperatures = np.asarray(temperatures, dtype=float)
+    cold_expense = 4.39 * np.exp(-0.49 * temperatures)
+    warm_expense = 0.11 * np.exp(0.31 * temperatures)
+    return np.where(temperatures < 3.5, cold_expense, np.where(temperatures < 6.5, 0.0, warm_expense)) * expense_scale(tick_seconds)
+
+class BatchCoolerInstance():
+    """
+    Represents many independent cooler rooms, e.g. one per simulated month.
+    The state of every room is held in arrays of shape (room_count,), and all rooms
+    are advanced one tick at a time, so a batch of months costs 8640 vector steps.
+    Any horizon can be simulated, the amount of ticks is taken from the power prices.
+    """
+    def __init__(self, thermostat_instance: therm.Thermostat, power_prices, room_count: int, rng: np.random.Generator = None,
+                 door_model: door_events.DoorModel = None, tick_seconds: int = 300, physical_constants: physics.PhysicalConstants = None):
+        self.tick_counter = 0
+
+        self.thermostat_instance = thermostat_instance
+        self.power_prices = power_prices
+        self.room_count = room_count
+        self.tick_count = power_prices.shape[-1]
+        self.tick_seconds = tick_seconds
+        self.physical_constants = physical_constants if physical_constants is not None else physics.PhysicalConstants()
+        self.temperature_slopes, self.temperature_offsets = self.physical_constants.transition_table(tick_seconds)
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.door_model = door_model if door_model is not None else door_events.BernoulliDoorModel()
+
+        self.door_states = None # Door states of the current chunk of ticks, shape (chunk ticks, room_count)
+        self.door_chunk_start = 0
+
+        self.current_temperature = np.full(room_count, 5.0)
+
+        self.food_loss_expenses = np.zeros(room_count)
+        self.power_expenses = np.zeros(room_count)
+
+        self.temperature_thresholds = None
+        thermostat_instance.attach_room(self)
+
+    @classmethod
+    def for_rooms(cls, thermostat_instance: therm.Thermostat, power_prices, current_temperature: np.ndarray, tick_seconds: int = 300,
+                  physical_constants: physics.PhysicalConstants = None, door_model: door_events.DoorModel = None) -> "BatchCoolerInstance":
+        """
+        A batch of rooms that are already at the given temperatures, e.g. some of the rooms of a fleet,
+        for asking a thermostat about them. Move it to another tick by setting current_temperature and tick_counter.
+
+        >>> batch = BatchCoolerInstance.for_rooms(therm.SimpleThermostat(), np.ones(10), np.array([4.0, 6.0]))
+        >>> batch.thermostat_instance.evaluate_cooler_state_batch(batch).tolist()
+        [False, True]
+        """
+        batch = cls(thermostat_instance, power_prices, len(current_temperature), door_model=door_model, tick_seconds=tick_seconds, physical_constants=physical_constants)
+        batch.current_temperature = np.asarray(current_temperature, dtype=float)
+        return batch
 
-    def calculate_food_loss_expense(self, temp):
+    @property
+    def current_prices(self):
         """
-        Calculates the expense of food loss in a 5 minute period, at the input temperature
+        The power price(s) at the current tick
         """
-        if temp < 3.5:
-            return 4.39 * math.exp(-0.49 * temp)
-        elif temp < 6.5:
-            return 0.0
+        return self.power_prices[..., self.tick_counter]
+
+    def room_view(self, index: int) -> SimpleNamespace:
+        """
+        A single-room view of the batch, with the attributes a thermostat reads from a CoolerInstance
+        """
+        power_prices = self.power_prices if self.power_prices.ndim == 1 else self.power_prices[index]
+        return SimpleNamespace(current_temperature=self.current_temperature[index], tick_counter=self.tick_counter, power_prices=power_prices)
+
+    def is_door_open(self) -> np.ndarray:
+        """
+        Checks if the door is open in every room at the current tick.
+        The door model is asked for DOOR_CHUNK_TICKS ticks at a time.
+        """
+        chunk_tick = self.tick_counter - self.door_chunk_start
+        if self.door_states is None or chunk_tick >= len(self.door_states):
+            initial_state = None if self.door_states is None else self.door_states[-1]
+            tick_count = min(DOOR_CHUNK_TICKS, self.tick_count - self.tick_counter)
+            self.door_states = self.door_model.draw(self.rng, self.room_count, tick_count, self.tick_counter, initial_state).T
+            self.door_chunk_start = self.tick_counter
+            chunk_tick = 0
+        return self.door_states[chunk_tick]
+
+    def reset(self):
+        """
+        Puts every room back at tick 0, with a temperature of 5 degrees and no expenses
+        """
+        self.current_temperature = np.full(self.room_count, 5.0)
+        self.food_loss_expenses.fill(0.0)
+        self.power_expenses.fill(0.0)
+        self.temperature_thresholds = self.thermostat_instance.compile_thresholds(self.power_prices)
+        self.door_states = None
+
+        self.tick_counter = 0
+
+    def run_until(self, end_tick: int):
+        """
+        Advances every room until end_tick, continuing from the current state
+        """
+        while self.tick_counter < end_tick:
+            self.simulate_tick()
+            self.tick_counter += 1
+
+    def simulate_month(self) -> tuple:
+        """
+        Simulates every room in the batch for a month (or whatever horizon the power prices cover),
+        returns the total food loss and power expenses per room
+        """
+        self.reset()
+        self.run_until(self.tick_count)
+
+        return (self.food_loss_expenses.copy(), self.power_expenses.copy())
+
+    def simulate_periods(self, period_starts: np.ndarray) -> tuple:
+        """
+        Simulates the whole horizon, returns the food loss and power expenses per room and period,
+        as arrays of shape (room_count, period count). period_starts holds the first tick of every period.
+        Only the totals at the period boundaries are kept, so memory doesn't grow with the horizon.
+        """
+        self.reset()
+        period_ends = list(period_starts[1:]) + [self.tick_count]
+        food_loss_expenses = np.zeros((self.room_count, len(period_ends)))
+        power_expenses = np.zeros((self.room_count, len(period_ends)))
+
+        for period_index, period_end in enumerate(period_ends):
+            food_loss_before = self.food_loss_expenses.copy()
+            power_before = self.power_expenses.copy()
+            self.run_until(period_end)
+            food_loss_expenses[:, period_index] = self.food_loss_expenses - food_loss_before
+            power_expenses[:, period_index] = self.power_expenses - power_before
+
+        return (food_loss_expenses, power_expenses)
+
+    def simulate_tick(self):
+        """
+        Logic for a 5 minute interval, applied to every room at once.
+        Same physics as CoolerInstance.simulate_tick, with the transition table indexed by arrays.
+        """
+        last_temp = self.current_temperature
+
+        door_open = self.is_door_open()
+        if self.temperature_thresholds is not None:
+            comp_on = last_temp > self.temperature_thresholds[..., self.tick_counter]
         else:
-            return 0.11 * math.exp(0.31 * temp)
+            comp_on = self.thermostat_instance.evaluate_cooler_state_batch(self)
+
+        transition = 2 * door_open + comp_on
+        t = self.temperature_slopes[transition] * last_temp + self.temperature_offsets[transition]
+
+        self.power_expenses += np.where(comp_on, self.current_prices * expense_scale(self.tick_seconds), 0.0)
+        self.food_loss_expenses += calculate_food_loss_expenses(t, self.tick_seconds)
+
+        self.current_temperature = t
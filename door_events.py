@@ -0,0 +1,141 @@
+"""
+Holds the door models, which decide when the cooler door is open.
+A door model draws the door states of many ticks at once from a numpy random Generator,
+so a seeded Generator makes a simulation reproducible.
+"""
+from enum import Enum
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+class DoorModel(ABC):
+    """
+    Door model base class.
+    """
+    @abstractmethod
+    def draw(self, rng: np.random.Generator, room_count: int, tick_count: int, start_tick: int = 0, initial_state: np.ndarray = None) -> np.ndarray:
+        """
+        Returns the door states of room_count rooms for tick_count ticks, as a bool array of shape (room_count, tick_count).
+        start_tick is the tick of the first drawn state, and initial_state the door states at the tick before it,
+        so a long period can be drawn in several chunks.
+        """
+
+    def open_probabilities(self, tick_count: int) -> np.ndarray:
+        """
+        The probability of the door being open at every tick, from tick 0.
+        Estimated from drawn door states, door models that know it exactly override this.
+        """
+        return self.draw(np.random.default_rng(0), 1000, tick_count).mean(axis=0)
+
+class BernoulliDoorModel(DoorModel):
+    """
+    The door is open at every tick with the same probability, independently of the other ticks
+    """
+    def __init__(self, open_probability: float = 0.1):
+        self.open_probability = open_probability
+
+    def draw(self, rng, room_count, tick_count, start_tick=0, initial_state=None) -> np.ndarray:
+        return rng.random((room_count, tick_count)) < self.open_probability
+
+    def open_probabilities(self, tick_count: int) -> np.ndarray:
+        return np.full(tick_count, float(self.open_probability))
+
+class TimeOfDayDoorModel(DoorModel):
+    """
+    The door is opened more often during working hours. The probability of the door being open
+    is looked up per hour of the day. Ticks are tick_seconds long, and tick 0 is start_seconds after midnight.
+
+    >>> model = TimeOfDayDoorModel(hourly_probabilities=[0.0] * 12 + [1.0] * 12)
+    >>> model.draw(np.random.default_rng(0), 1, 288)[0].sum()
+    np.int64(144)
+    >>> TimeOfDayDoorModel(tick_seconds=3600, start_seconds=6 * 3600).open_probabilities(24)[[0, 12, 18]].tolist()
+    [0.15, 0.05, 0.01]
+    """
+    def __init__(self, hourly_probabilities: list = None, tick_seconds: int = 300, start_seconds: int = 0):
+        if hourly_probabilities is None:
+            hourly_probabilities = [0.01] * 6 + [0.15] * 12 + [0.05] * 6 # Quiet at night, busy from 6 to 18
+        if len(hourly_probabilities) != 24:
+            raise ValueError("hourly_probabilities needs a probability for each of the 24 hours")
+        self.hourly_probabilities = np.asarray(hourly_probabilities, dtype=float)
+        self.tick_seconds = tick_seconds
+        self.start_seconds = start_seconds
+
+    def hours(self, ticks: np.ndarray) -> np.ndarray:
+        """
+        The hour of the day of every tick
+        """
+        return ((self.start_seconds + ticks * self.tick_seconds) // 3600) % 24
+
+    def draw(self, rng, room_count, tick_count, start_tick=0, initial_state=None) -> np.ndarray:
+        hours = self.hours(np.arange(start_tick, start_tick + tick_count))
+        return rng.random((room_count, tick_count)) < self.hourly_probabilities[hours]
+
+    def open_probabilities(self, tick_count: int) -> np.ndarray:
+        return self.hourly_probabilities[self.hours(np.arange(tick_count))]
+
+class MarkovDoorModel(DoorModel):
+    """
+    A door that is held open for a while. A closed door opens with open_probability,
+    and an open door stays open with stay_open_probability.
+    """
+    def __init__(self, open_probability: float = 0.07, stay_open_probability: float = 0.35):
+        self.open_probability = open_probability
+        self.stay_open_probability = stay_open_probability
+
+    def draw(self, rng, room_count, tick_count, start_tick=0, initial_state=None) -> np.ndarray:
+        random_values = rng.random((room_count, tick_count))
+        door_states = np.zeros((room_count, tick_count), dtype=bool)
+        door_open = np.zeros(room_count, dtype=bool) if initial_state is None else np.asarray(initial_state, dtype=bool)
+
+        # Only the door state itself is sequential, the random values are drawn up front
+        for tick in range(tick_count):
+            door_open = random_values[:, tick] < np.where(door_open, self.stay_open_probability, self.open_probability)
+            door_states[:, tick] = door_open
+        return door_states
+
+    def open_probabilities(self, tick_count: int) -> np.ndarray:
+        """
+        The probability of the door being open at every tick, for a door that is closed before tick 0
+
+        >>> MarkovDoorModel(0.5, 0.5).open_probabilities(2).tolist()
+        [0.5, 0.5]
+        """
+        probabilities = np.zeros(tick_count)
+        probability = 0.0
+        for tick in range(tick_count):
+            probability = probability * self.stay_open_probability + (1 - probability) * self.open_probability
+            probabilities[tick] = probability
+        return probabilities
+
+class DoorModelType(Enum):
+    """
+    An enumerator that returns the corresponding class
+    """
+    BERNOULLI = BernoulliDoorModel
+    TIME_OF_DAY = TimeOfDayDoorModel
+    MARKOV = MarkovDoorModel
+
+def door_model_from_config(door_config: dict, tick_seconds: int = 300, start_seconds: int = 0) -> DoorModel:
+    """
+    Builds a door model from the door_model section of the config.
+    The type is the name of a DoorModelType, the other keys are passed to the class.
+    Door models that follow the time of day get the tick length and the time of day of tick 0 (seconds after midnight) of the prices.
+
+    >>> door_model_from_config({"type": "BERNOULLI", "open_probability": 0.2}).open_probability
+    0.2
+    >>> type(door_model_from_config(None)).__name__
+    'BernoulliDoorModel'
+    >>> door_model_from_config({"type": "TIME_OF_DAY"}, tick_seconds=3600).open_probabilities(24)[[0, 6, 18]].tolist()
+    [0.01, 0.15, 0.05]
+    """
+    if not door_config:
+        return BernoulliDoorModel()
+    parameters = dict(door_config)
+    type_name = parameters.pop("type", "BERNOULLI")
+    try:
+        door_model_class = DoorModelType[type_name].value
+    except KeyError as exc:
+        raise ValueError(f"Invalid DoorModelType: {type_name}") from exc
+    if issubclass(door_model_class, TimeOfDayDoorModel):
+        parameters.update(tick_seconds=tick_seconds, start_seconds=start_seconds)
+    return door_model_class(**parameters)
@@ -0,0 +1,93 @@
+"""
+Reduces long series to fewer points before plotting, keeping the shape a plot of every point would show.
+"""
+import numpy as np
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, point_count: int) -> np.ndarray:
+    """
+    The indices of point_count points picked by Largest-Triangle-Three-Buckets (Steinarsson, 2013).
+    The first and last points are always kept. Every bucket in between keeps the point that forms the largest
+    triangle with the point kept in the previous bucket and the average of the next bucket.
+
+    >>> y = np.array([0.0, 0.0, 5.0, 0.0, 0.0, 0.0, -5.0, 0.0, 0.0, 0.0])
+    >>> lttb_indices(np.arange(10), y, 4).tolist()
+    [0, 2, 6, 9]
+    """
+    length = len(y)
+    if point_count >= length or point_count < 3:
+        return np.arange(length)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    bucket_edges = np.linspace(1, length - 1, point_count - 1).astype(int) # point_count - 2 buckets between the first and last point
+
+    indices = np.zeros(point_count, dtype=np.int64)
+    indices[-1] = length - 1
+    selected = 0
+    for bucket in range(point_count - 2):
+        start, end = bucket_edges[bucket], bucket_edges[bucket + 1]
+        if bucket + 2 < len(bucket_edges):
+            next_start, next_end = bucket_edges[bucket + 1], bucket_edges[bucket + 2]
+        else:
+            next_start, next_end = length - 1, length # The last bucket looks ahead to the last point
+        average_x = x[next_start:next_end].mean()
+        average_y = y[next_start:next_end].mean()
+
+        areas = np.abs((x[selected] - average_x) * (y[start:end] - y[selected]) - (x[selected] - x[start:end]) * (average_y - y[selected]))
+        selected = start + int(np.argmax(areas))
+        indices[bucket + 1] = selected
+    return indices
+
+def min_max_indices(y: np.ndarray, bin_count: int) -> np.ndarray:
+    """
+    The indices of the lowest and highest point of every bin, in order, so every peak and dip is kept.
+    Gives at most 2 * bin_count points.
+
+    >>> min_max_indices(np.array([1.0, 3.0, 2.0, 0.0, 5.0, 4.0]), 2).tolist()
+    [0, 1, 3, 4]
+    """
+    length = len(y)
+    if 2 * bin_count >= length:
+        return np.arange(length)
+    bin_edges = np.linspace(0, length, bin_count + 1).astype(int)
+    indices = []
+    for start, end in zip(bin_edges[:-1], bin_edges[1:]):
+        lowest = start + int(np.argmin(y[start:end]))
+        highest = start + int(np.argmax(y[start:end]))
+        indices += sorted({lowest, highest})
+    return np.array(indices)
+
+def downsample(x: np.ndarray, y: np.ndarray, point_count: int = None, method: str = "LTTB") -> tuple:
+    """
+    Downsamples a series to about point_count points with "LTTB" or "MINMAX". None keeps every point.
+
+    >>> x, y = downsample(np.arange(1000), np.sin(np.arange(1000) / 50), 100)
+    >>> len(x), len(y)
+    (100, 100)
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if point_count is None:
+        return x, y
+    if method == "LTTB":
+        indices = lttb_indices(x, y, point_count)
+    elif method == "MINMAX":
+        indices = min_max_indices(y, max(1, point_count // 2))
+    else:
+        raise ValueError(f"Invalid downsampling method: {method}")
+    return x[indices], y[indices]
+
+def bin_means(values: np.ndarray, bin_count: int = None) -> tuple:
+    """
+    The mean of every bin of a series, e.g. the fraction of ticks a door is open, and the bin edges.
+    None gives a bin per value.
+
+    >>> means, edges = bin_means(np.array([True, False, True, True]), 2)
+    >>> means.tolist(), edges.tolist()
+    ([0.5, 1.0], [0, 2, 4])
+    """
+    values = np.asarray(values, dtype=float)
+    length = len(values)
+    if bin_count is None or bin_count >= length:
+        return values, np.arange(length + 1)
+    bin_edges = np.linspace(0, length, bin_count + 1).astype(int)
+    return np.add.reduceat(values, bin_edges[:-1]) / np.diff(bin_edges), bin_edges
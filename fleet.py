@@ -0,0 +1,228 @@
+"""
+Simulates a site with many cooler rooms, which share one power price feed.
+
+Every room has its own temperature, physical constants, door probability and thermostat. They are held as
+arrays with one value per room (struct of arrays), and the whole fleet is advanced one tick at a time.
+The site can limit how many compressors may run at once, then the warmest rooms get to run first.
+"""
+from types import SimpleNamespace
+
+import numpy as np
+
+import cooler_instance as ci
+import door_events
+import physics
+import thermostat as therm
+
+class FleetResult():
+    """
+    The load and cost curves of the site, per tick, and the expenses of every room
+    """
+    def __init__(self, tick_count: int, room_count: int):
+        self.compressor_load = np.zeros(tick_count, dtype=np.int64) # Compressors running per tick
+        self.denied_requests = np.zeros(tick_count, dtype=np.int64) # Compressors that wanted to run, but were over the limit
+        self.power_expenses = np.zeros(tick_count) # Power expenses of the site per tick
+        self.food_loss_expenses = np.zeros(tick_count)
+        self.room_power_expenses = np.zeros(room_count)
+        self.room_food_loss_expenses = np.zeros(room_count)
+
+    def summary(self) -> str:
+        room_expenses = self.room_power_expenses + self.room_food_loss_expenses
+        return "\n".join([
+            f"Rooms: {len(room_expenses)}",
+            f"Total food expense: {np.sum(self.food_loss_expenses):.2f} kr.",
+            f"Total power expense: {np.sum(self.power_expenses):.2f} kr.",
+            f"Expense per room: mean {np.mean(room_expenses):.2f} kr., min {np.min(room_expenses):.2f} kr., max {np.max(room_expenses):.2f} kr.",
+            f"Compressors running: mean {np.mean(self.compressor_load):.1f}, peak {np.max(self.compressor_load)}",
+            f"Ticks where the compressor limit denied a request: {np.count_nonzero(self.denied_requests)}",
+        ])
+
+class Fleet():
+    """
+    A fleet of cooler rooms. assignment holds the index in thermostats of every room's thermostat.
+    physical_constants may have a value per room in every constant, door_probabilities may be a single
+    probability or one per room.
+    """
+    def __init__(self, thermostats: list, assignment: np.ndarray, power_prices: np.ndarray, physical_constants: physics.PhysicalConstants = None,
+                 door_probabilities=0.1, max_running_compressors: int = None, rng: np.random.Generator = None, tick_seconds: int = 300):
+        self.thermostats = thermostats
+        self.assignment = np.asarray(assignment, dtype=np.int64)
+        self.room_count = len(self.assignment)
+        self.power_prices = np.asarray(power_prices, dtype=float)
+        self.tick_count = len(self.power_prices)
+        self.door_probabilities = np.broadcast_to(np.asarray(door_probabilities, dtype=float), (self.room_count,))
+        self.max_running_compressors = max_running_compressors
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.tick_seconds = tick_seconds
+
+        if np.any(self.assignment < 0) or np.any(self.assignment >= len(thermostats)):
+            raise ValueError("Every room must be assigned one of the thermostats")
+
+        # The transition table of every room, flattened so room r and transition i are at 4 * r + i
+        physical_constants = physical_constants if physical_constants is not None else physics.PhysicalConstants()
+        self.physical_constants = physical_constants
+        slopes, offsets = physical_constants.transition_table(tick_seconds)
+        self.temperature_slopes = np.broadcast_to(slopes.reshape(4, -1), (4, self.room_count)).T.ravel()
+        self.temperature_offsets = np.broadcast_to(offsets.reshape(4, -1), (4, self.room_count)).T.ravel()
+        self.table_rows = 4 * np.arange(self.room_count)
+
+        self.current_temperature = np.full(self.room_count, 5.0)
+        self.tick_counter = 0
+
+        self.room_descriptions = [self.room_description(np.flatnonzero(self.assignment == index)) for index in range(len(thermostats))]
+        for thermostat, description in zip(thermostats, self.room_descriptions):
+            if isinstance(thermostat, therm.OptimalThermostat) and description.door_model is None:
+                raise ValueError("The OPTIMAL thermostat plans for one room, all its rooms in a fleet need the same physical constants and door probability")
+            thermostat.attach_room(description)
+
+    def room_description(self, rooms: np.ndarray) -> SimpleNamespace:
+        """
+        The door model, physical constants and tick length of the rooms, as attach_room reads them from a cooler.
+        If the rooms differ, the constants have a value per room and the door model is None.
+
+        >>> site = Fleet([therm.SimpleThermostat()], [0, 0], np.ones(10), door_probabilities=[0.1, 0.2])
+        >>> site.room_description(np.array([0])).door_model.open_probability, site.room_description(np.array([0, 1])).door_model
+        (0.1, None)
+        """
+        physical_constants = self.room_constants(rooms)
+        uniform = all(np.all(value == value[:1]) for value in vars(physical_constants).values())
+        uniform = uniform and np.all(self.door_probabilities[rooms] == self.door_probabilities[rooms][:1])
+        if not uniform or len(rooms) == 0:
+            return SimpleNamespace(door_model=None, physical_constants=physical_constants, tick_seconds=self.tick_seconds)
+        room_constants = physics.PhysicalConstants(**{name: float(value[0]) for name, value in vars(physical_constants).items()})
+        return SimpleNamespace(door_model=door_events.BernoulliDoorModel(float(self.door_probabilities[rooms[0]])),
+                               physical_constants=room_constants, tick_seconds=self.tick_seconds)
+
+    def compile_threshold_matrix(self) -> tuple:
+        """
+        The temperature cutoffs of every thermostat per tick, shape (thermostat count, ticks).
+        Rows of thermostats that can't be compiled are +inf, they are returned as the second value.
+        """
+        threshold_matrix = np.full((len(self.thermostats), self.tick_count), np.inf)
+        uncompiled = []
+        for index, thermostat in enumerate(self.thermostats):
+            thresholds = thermostat.compile_thresholds(self.power_prices)
+            if thresholds is None:
+                uncompiled.append(index)
+            else:
+                threshold_matrix[index] = thresholds
+        return threshold_matrix, uncompiled
+
+    def room_constants(self, rooms: np.ndarray) -> physics.PhysicalConstants:
+        """
+        The physical constants of some of the rooms, with a value per room
+        """
+        return physics.PhysicalConstants(**{name: np.broadcast_to(value, (self.room_count,))[rooms] for name, value in vars(self.physical_constants).items()})
+
+    def uncompiled_groups(self, uncompiled: list) -> list:
+        """
+        The rooms of every thermostat without compiled thresholds, and a batch of them to ask the thermostat about
+        """
+        groups = []
+        for index in uncompiled:
+            rooms = np.flatnonzero(self.assignment == index)
+            description = self.room_descriptions[index]
+            groups.append((rooms, ci.BatchCoolerInstance.for_rooms(self.thermostats[index], self.power_prices, self.current_temperature[rooms],
+                                                                   self.tick_seconds, description.physical_constants, description.door_model)))
+        return groups
+
+    def evaluate_uncompiled(self, comp_on: np.ndarray, groups: list):
+        """
+        Asks the thermostats without compiled thresholds for the decisions of their rooms, see uncompiled_groups
+        """
+        for rooms, group in groups:
+            group.current_temperature = self.current_temperature[rooms]
+            group.tick_counter = self.tick_counter
+            comp_on[rooms] = group.thermostat_instance.evaluate_cooler_state_batch(group)
+
+    def limit_compressors(self, comp_on: np.ndarray) -> int:
+        """
+        Turns off the compressors over the site limit, keeping the warmest rooms running. Returns how many were turned off.
+        """
+        requested = np.flatnonzero(comp_on)
+        if self.max_running_compressors is None or len(requested) <= self.max_running_compressors:
+            return 0
+        comp_on[:] = False
+        if self.max_running_compressors > 0:
+            warmest = np.argpartition(-self.current_temperature[requested], self.max_running_compressors - 1)[:self.max_running_compressors]
+            comp_on[requested[warmest]] = True
+        return len(requested) - self.max_running_compressors
+
+    def door_chunks(self):
+        """
+        Yields the first tick and the door states (ticks, rooms) of every chunk of the horizon
+        """
+        for chunk_start in range(0, self.tick_count, ci.DOOR_CHUNK_TICKS):
+            chunk_ticks = min(ci.DOOR_CHUNK_TICKS, self.tick_count - chunk_start)
+            yield chunk_start, self.rng.random((chunk_ticks, self.room_count)) < self.door_probabilities
+
+    def advance(self, comp_on: np.ndarray, door_open: np.ndarray, result: FleetResult):
+        """
+        Applies the compressor limit to the wanted compressor states, moves every room one tick and records the expenses of the tick
+        """
+        result.denied_requests[self.tick_counter] = self.limit_compressors(comp_on)
+
+        transition = self.table_rows + 2 * door_open + comp_on
+        self.current_temperature = self.temperature_slopes.take(transition) * self.current_temperature + self.temperature_offsets.take(transition)
+
+        price = self.power_prices[self.tick_counter] * ci.expense_scale(self.tick_seconds)
+        food_loss_expenses = ci.calculate_food_loss_expenses(self.current_temperature, self.tick_seconds)
+        running = np.count_nonzero(comp_on)
+        result.compressor_load[self.tick_counter] = running
+        result.power_expenses[self.tick_counter] = running * price
+        result.food_loss_expenses[self.tick_counter] = np.sum(food_loss_expenses)
+        result.room_power_expenses[comp_on] += price
+        result.room_food_loss_expenses += food_loss_expenses
+
+    def simulate_month(self) -> FleetResult:
+        """
+        Simulates every room for the horizon of the power prices, starting at 5 degrees
+        """
+        result = FleetResult(self.tick_count, self.room_count)
+        threshold_matrix, uncompiled = self.compile_threshold_matrix()
+        self.current_temperature = np.full(self.room_count, 5.0)
+        groups = self.uncompiled_groups(uncompiled)
+
+        for chunk_start, door_states in self.door_chunks():
+            for chunk_tick in range(len(door_states)):
+                self.tick_counter = chunk_start + chunk_tick
+                comp_on = self.current_temperature > threshold_matrix[:, self.tick_counter].take(self.assignment)
+                if groups:
+                    self.evaluate_uncompiled(comp_on, groups)
+                self.advance(comp_on, door_states[chunk_tick], result)
+        self.tick_counter = self.tick_count
+        return result
+
+def fleet_from_config(fleet_config: dict, power_prices: np.ndarray, physical_constants: physics.PhysicalConstants = None,
+                      tick_seconds: int = 300, seed: int = None) -> Fleet:
+    """
+    Builds a fleet from the fleet section of the config. The thermostat types are spread over the rooms by their
+    shares, and the physical constants and door probabilities of every room vary randomly around the given values.
+
+    >>> fleet = fleet_from_config({"room_count": 4, "thermostats": {"SIMPLE": 1, "PARTITION": 1}}, np.ones(10), seed=0)
+    >>> fleet.assignment.tolist(), len(fleet.temperature_slopes)
+    ([0, 0, 1, 1], 16)
+    """
+    physical_constants = physical_constants if physical_constants is not None else physics.PhysicalConstants()
+    rng = np.random.default_rng(seed)
+    room_count = fleet_config.get("room_count", 1000)
+
+    thermostat_shares = fleet_config.get("thermostats", {"SIMPLE": 1})
+    thermostats = []
+    for thermostat_type in thermostat_shares:
+        if thermostat_type not in therm.ThermostatType.__members__:
+            raise ValueError(f"Invalid ThermostatType: {thermostat_type}")
+        thermostats.append(therm.ThermostatType[thermostat_type].value())
+    shares = np.array(list(thermostat_shares.values()), dtype=float)
+    room_ends = np.round(np.cumsum(shares) / np.sum(shares) * room_count).astype(np.int64)
+    assignment = np.searchsorted(room_ends, np.arange(room_count), side="right")
+
+    variation = fleet_config.get("variation", 0.0) # Relative spread of the heat transfer coefficients between rooms
+    def varied(value):
+        return value * rng.uniform(1 - variation, 1 + variation, room_count)
+    room_constants = physics.PhysicalConstants(
+        physical_constants.outside_temperature, physical_constants.compressor_temperature,
+        varied(physical_constants.wall_coefficient), varied(physical_constants.door_coefficient), varied(physical_constants.compressor_coefficient))
+    door_probabilities = rng.uniform(fleet_config.get("min_door_probability", 0.1), fleet_config.get("max_door_probability", 0.1), room_count)
+
+    return Fleet(thermostats, assignment, power_prices, room_constants, door_probabilities, fleet_config.get("max_running_compressors"), rng, tick_seconds)
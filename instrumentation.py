@@ -0,0 +1,112 @@
+"""
+Opt-in timing of the phases of the scalar simulation loop.
+
+Instrumentation.instrument_cooler replaces the methods of a CoolerInstance and its thermostat with timed
+versions on that instance only, so coolers that aren't instrumented run the original code without any overhead.
+Nested phases are timed both in total and on their own (self time): the self time of simulate_tick
+is the physics and bookkeeping of the tick, without the door, thermostat and expense calls.
+"""
+import json
+import time
+
+import numpy as np
+
+class Instrumentation():
+    """
+    Collects the time and call count of every phase, and how often every thermostat turned the compressor on
+
+    >>> class Room():
+    ...     def step(self):
+    ...         return self.inner()
+    ...     def inner(self):
+    ...         return 1
+    >>> instrumentation = Instrumentation()
+    >>> room = Room()
+    >>> instrumentation.instrument(room, "room", ["step", "inner"])
+    >>> room.step(), room.step()
+    (1, 1)
+    >>> instrumentation.phases[("room", "step")][2], instrumentation.phases[("room", "inner")][2]
+    (2, 2)
+    """
+    def __init__(self):
+        self.phases = {} # (label, phase) -> [total seconds, self seconds, calls]
+        self.decisions = {} # label -> [ticks, ticks with the compressor on]
+        self._child_seconds = [] # Time spent in timed calls below each running timed call
+
+    def timed(self, label: str, phase: str, function):
+        """
+        Wraps a function so every call is added to the phase
+        """
+        def timed_function(*args, **kwargs):
+            self._child_seconds.append(0.0)
+            start_time = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed_time = time.perf_counter() - start_time
+                child_seconds = self._child_seconds.pop()
+                record = self.phases.setdefault((label, phase), [0.0, 0.0, 0])
+                record[0] += elapsed_time
+                record[1] += elapsed_time - child_seconds
+                record[2] += 1
+                if self._child_seconds:
+                    self._child_seconds[-1] += elapsed_time
+        return timed_function
+
+    def instrument(self, target, label: str, method_names: list):
+        """
+        Replaces the methods of a single object with timed versions
+        """
+        for method_name in method_names:
+            setattr(target, method_name, self.timed(label, method_name, getattr(target, method_name)))
+
+    def instrument_cooler(self, cooler, label: str = None):
+        """
+        Times the tick loop of a CoolerInstance and the calls to its thermostat,
+        and counts the compressor decisions of every month
+        """
+        if label is None:
+            label = type(cooler.thermostat_instance).__name__
+        self.instrument(cooler.thermostat_instance, label, ["evaluate_cooler_state", "compile_thresholds"])
+        self.instrument(cooler, label, ["simulate_month", "simulate_tick", "is_door_open"])
+
+        settle_expenses = self.timed(label, "settle_expenses", cooler.settle_expenses)
+        decisions = self.decisions.setdefault(label, [0, 0])
+        def counted_settle_expenses(tick_count: int):
+            if tick_count > 0: # Every tick passes through the buffer once, so this sees every decision
+                decisions[0] += tick_count
+                decisions[1] += int(np.count_nonzero(cooler.compressor_buffer[:tick_count]))
+            return settle_expenses(tick_count)
+        cooler.settle_expenses = counted_settle_expenses
+
+    def decision_rates(self) -> dict:
+        """
+        The fraction of ticks with the compressor on, per label
+        """
+        return {label: on_ticks / ticks if ticks else float("nan") for label, (ticks, on_ticks) in self.decisions.items()}
+
+    def to_dict(self) -> dict:
+        return {
+            "phases": [{"label": label, "phase": phase, "calls": calls, "total_seconds": total_seconds, "self_seconds": self_seconds}
+                       for (label, phase), (total_seconds, self_seconds, calls) in self.phases.items()],
+            "decisions": {label: {"ticks": ticks, "compressor_on_ticks": on_ticks, "compressor_on_rate": self.decision_rates()[label]}
+                          for label, (ticks, on_ticks) in self.decisions.items()},
+        }
+
+    def summary(self) -> str:
+        """
+        A table of the phases, slowest first, and the decision rates
+        """
+        lines = [f"{'Thermostat':<30} {'Phase':<22} {'Calls':>10} {'Total (s)':>10} {'Self (s)':>10} {'Per call (us)':>14}"]
+        for (label, phase), (total_seconds, self_seconds, calls) in sorted(self.phases.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{label:<30} {phase:<22} {calls:>10} {total_seconds:>10.3f} {self_seconds:>10.3f} {total_seconds / calls * 1e6:>14.2f}")
+        for label, rate in self.decision_rates().items():
+            lines.append(f"{label}: compressor on in {rate * 100:.1f}% of {self.decisions[label][0]} ticks")
+        return "\n".join(lines)
+
+    def dump(self, path: str):
+        """
+        Writes the measurements to a json file
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=2)
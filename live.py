@@ -0,0 +1,249 @@
+"""
+Runs the thermostats as live controllers, which decide tick by tick from a stream of price and temperature updates
+instead of a known month of prices.
+
+A feed delivers the updates and receives the decisions. ReplayFeed replays the power price history for a
+simulated fleet of rooms, a feed for real rooms only needs the same updates() and send() methods.
+The controller only sees prices that have arrived. Thermostats that look at future prices get a causal version:
+    PEERREVIEW compares the price to the mean of the last 2 * look_around_ticks prices, instead of the prices around it
+    PARTITION buys when the price is among the purchase_per_partition cheapest of the last partition_size prices
+Their rolling state is updated once per price, and the decisions of all rooms of a thermostat are one array comparison.
+"""
+import asyncio
+from bisect import bisect_left, insort
+from collections import deque
+import math
+import time
+
+import numpy as np
+
+import fleet
+import streaming
+import thermostat as therm
+
+class RollingMean():
+    """
+    The mean of the last window_size values, updated with a running sum
+
+    >>> rolling = RollingMean(2)
+    >>> [rolling.add(value) for value in [1.0, 3.0, 5.0]]
+    [1.0, 2.0, 4.0]
+    """
+    def __init__(self, window_size: int):
+        self.values = deque(maxlen=window_size)
+        self.total = 0.0
+
+    def add(self, value: float) -> float:
+        """
+        Adds a value, and returns the mean of the window
+        """
+        if len(self.values) == self.values.maxlen:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+        return self.total / len(self.values)
+
+class RollingRank():
+    """
+    The last window_size values, also kept sorted, so the k'th smallest is a lookup
+
+    >>> rolling = RollingRank(3)
+    >>> for value in [4.0, 1.0, 3.0, 2.0]:
+    ...     rolling.add(value)
+    >>> rolling.smallest(0), rolling.smallest(2)
+    (1.0, 3.0)
+    """
+    def __init__(self, window_size: int):
+        self.values = deque(maxlen=window_size)
+        self.sorted_values = []
+
+    def add(self, value: float):
+        if len(self.values) == self.values.maxlen:
+            del self.sorted_values[bisect_left(self.sorted_values, self.values[0])]
+        self.values.append(value)
+        insort(self.sorted_values, value)
+
+    def smallest(self, rank: int) -> float:
+        """
+        The value at the rank (0 is the smallest) in the window
+        """
+        return self.sorted_values[rank]
+
+class PriceOnlyPolicy():
+    """
+    A thermostat whose temperature cutoff only depends on the current price, so its compiled thresholds are already causal.
+    Thermostats that can't compile their thresholds are rejected.
+
+    >>> class Uncompiled(therm.SimpleThermostat):
+    ...     def compile_thresholds(self, power_prices):
+    ...         return None
+    >>> PriceOnlyPolicy(Uncompiled())
+    Traceback (most recent call last):
+    ...
+    ValueError: Uncompiled can't compile its thresholds, so it has no live version
+    """
+    def __init__(self, thermostat: therm.Thermostat):
+        if thermostat.compile_thresholds(np.zeros(1)) is None:
+            raise ValueError(f"{type(thermostat).__name__} can't compile its thresholds, so it has no live version")
+        self.thermostat = thermostat
+
+    def threshold(self, price: float) -> float:
+        return float(self.thermostat.compile_thresholds(np.array([price]))[0])
+
+class PeerReviewPolicy():
+    """
+    PEERREVIEW, comparing the price to the mean of the last 2 * look_around_ticks prices
+    """
+    def __init__(self, thermostat: therm.PeerReviewThermostat):
+        self.thermostat = thermostat
+        self.window = RollingMean(2 * thermostat.look_around_ticks)
+
+    def threshold(self, price: float) -> float:
+        return float(self.thermostat.thresholds_from_peer_prices(price, self.window.add(price)))
+
+class PartitionPolicy():
+    """
+    PARTITION, buying when the price is among the purchase_per_partition cheapest of the last partition_size prices.
+    Until the window is full, the amount bought is scaled down with it.
+    """
+    def __init__(self, thermostat: therm.PartitionThermostat):
+        self.thermostat = thermostat
+        self.window_size = max(1, round(thermostat.partition_size))
+        self.window = RollingRank(self.window_size)
+
+    def threshold(self, price: float) -> float:
+        self.window.add(price)
+        purchases = math.ceil(self.thermostat.purchase_ticks * len(self.window.values) / self.window_size)
+        price_cutoff = self.window.smallest(min(purchases, len(self.window.values)) - 1) if purchases > 0 else -np.inf
+        return float(self.thermostat.thresholds_from_price_cutoffs(price, price_cutoff))
+
+def live_policy(thermostat: therm.Thermostat):
+    """
+    The causal live version of a thermostat
+
+    >>> type(live_policy(therm.PartitionThermostat())).__name__
+    'PartitionPolicy'
+    """
+    if isinstance(thermostat, therm.OptimalThermostat):
+        raise ValueError("The OPTIMAL thermostat plans with the prices of the whole month, it can't run live")
+    if isinstance(thermostat, therm.PeerReviewThermostat):
+        return PeerReviewPolicy(thermostat)
+    if isinstance(thermostat, therm.PartitionThermostat):
+        return PartitionPolicy(thermostat)
+    return PriceOnlyPolicy(thermostat)
+
+class FeedUpdate():
+    """
+    A price and/or temperature update of a feed. temperatures holds the temperatures of the rooms in rooms,
+    or of every room if rooms is None. received_ns is the time (time.perf_counter_ns) the feed received the update.
+    """
+    def __init__(self, tick: int, price: float = None, temperatures: np.ndarray = None, rooms: np.ndarray = None, received_ns: int = None):
+        self.tick = tick
+        self.price = price
+        self.temperatures = temperatures
+        self.rooms = rooms
+        self.received_ns = received_ns if received_ns is not None else time.perf_counter_ns()
+
+class LatencyStats():
+    """
+    The time from receiving an update to having the decisions of every room, in constant memory
+    """
+    def __init__(self, room_count: int):
+        self.room_count = room_count
+        self.accumulator = streaming.WelfordAccumulator()
+        self.quantiles = streaming.QuantileSketch((0.5, 0.99))
+
+    def add(self, latency_ns: int):
+        microseconds = latency_ns / 1000
+        self.accumulator.add(microseconds)
+        self.quantiles.add(microseconds)
+
+    def summary(self) -> str:
+        quantiles = self.quantiles.values
+        return "\n".join([
+            f"Decisions: {self.accumulator.count} updates for {self.room_count} rooms",
+            f"Latency per update: mean {self.accumulator.mean:.1f} µs, median {quantiles[0.5]:.1f} µs, 99th percentile {quantiles[0.99]:.1f} µs, max {self.accumulator.maximum:.1f} µs",
+            f"Latency per room decision: mean {self.accumulator.mean * 1000 / max(self.room_count, 1):.1f} ns",
+        ])
+
+class LiveController():
+    """
+    Decides the compressor state of many rooms from the updates of a feed.
+    assignment holds the index in thermostats of every room's thermostat.
+    """
+    def __init__(self, thermostats: list, assignment: np.ndarray):
+        self.policies = [live_policy(thermostat) for thermostat in thermostats]
+        self.assignment = np.asarray(assignment, dtype=np.int64)
+        self.room_count = len(self.assignment)
+        self.temperatures = np.full(self.room_count, 5.0)
+        self.room_thresholds = np.full(self.room_count, np.inf) # Nothing runs before the first price
+        self.latency = LatencyStats(self.room_count)
+
+    def decide(self, update: FeedUpdate) -> np.ndarray:
+        """
+        Applies the update and returns whether the compressor of every room should be on.
+        The rolling state of the thermostats only moves when the update has a price.
+        """
+        if update.temperatures is not None:
+            if update.rooms is None:
+                self.temperatures[:] = update.temperatures
+            else:
+                self.temperatures[update.rooms] = update.temperatures
+        if update.price is not None:
+            thresholds = np.array([policy.threshold(update.price) for policy in self.policies])
+            self.room_thresholds = thresholds.take(self.assignment)
+        decisions = self.temperatures > self.room_thresholds
+        self.latency.add(time.perf_counter_ns() - update.received_ns)
+        return decisions
+
+    async def run(self, feed) -> LatencyStats:
+        """
+        Decides on every update of the feed and sends the decisions back, until the feed ends
+        """
+        async for update in feed.updates():
+            await feed.send(update.tick, self.decide(update))
+        return self.latency
+
+class ReplayFeed():
+    """
+    Replays the power prices of a fleet one tick at a time, with the temperatures of its rooms.
+    The decisions sent back drive the rooms, and their expenses are kept in result.
+    interval_seconds is the wall-clock time between ticks, 0 replays as fast as possible.
+    """
+    def __init__(self, site: fleet.Fleet, interval_seconds: float = 0.0):
+        self.site = site
+        self.interval_seconds = interval_seconds
+        self.result = fleet.FleetResult(site.tick_count, site.room_count)
+        self.decisions = None
+
+    async def updates(self):
+        self.site.current_temperature = np.full(self.site.room_count, 5.0)
+        for chunk_start, door_states in self.site.door_chunks():
+            for chunk_tick in range(len(door_states)):
+                self.site.tick_counter = chunk_start + chunk_tick
+                self.decisions = None
+                yield FeedUpdate(self.site.tick_counter, float(self.site.power_prices[self.site.tick_counter]), self.site.current_temperature)
+                if self.decisions is None:
+                    raise ValueError(f"No decisions were sent for tick {self.site.tick_counter}")
+                self.site.advance(self.decisions, door_states[chunk_tick], self.result)
+                await asyncio.sleep(self.interval_seconds) # Also lets other tasks run between ticks
+        self.site.tick_counter = self.site.tick_count
+
+    async def send(self, tick: int, decisions: np.ndarray):
+        if tick != self.site.tick_counter:
+            raise ValueError(f"Decisions for tick {tick} arrived at tick {self.site.tick_counter}")
+        self.decisions = decisions
+
+def replay(site: fleet.Fleet, interval_seconds: float = 0.0) -> tuple:
+    """
+    Runs a live controller for the rooms of the fleet on a replay of its prices.
+    Returns the FleetResult and the LatencyStats.
+
+    >>> site = fleet.fleet_from_config({"room_count": 4, "thermostats": {"SIMPLE": 1, "PEERREVIEW": 1}}, np.ones(10), seed=0)
+    >>> result, latency = replay(site)
+    >>> latency.accumulator.count, result.compressor_load.shape
+    (10, (10,))
+    """
+    feed = ReplayFeed(site, interval_seconds)
+    latency = asyncio.run(LiveController(site.thermostats, site.assignment).run(feed))
+    return feed.result, latency
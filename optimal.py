@@ -0,0 +1,111 @@
+"""
+The cheapest possible way to run the compressor for a known price series, as a baseline for the thermostats.
+
+The room temperature is discretised into a grid, and backward dynamic programming over the ticks gives,
+for every tick and grid temperature, the minimum expected food loss and power expense of the rest of the horizon,
+and whether the compressor should be on. The door is random: every tick it is open with the probability
+the door model gives, independently of the other ticks (for a MarkovDoorModel this is an approximation).
+The physics and food loss are the same as in CoolerInstance, and all grid temperatures are handled at once per tick.
+"""
+import numpy as np
+
+import cooler_instance
+import door_events
+import physics
+
+class OptimalPolicy():
+    """
+    The solution of the dynamic program: whether the compressor is on, per tick and grid temperature,
+    and the minimum expected cost of the whole horizon per starting temperature.
+    A temperature between grid points uses the nearest grid point.
+    """
+    def __init__(self, grid: np.ndarray, compressor_on: np.ndarray, initial_costs: np.ndarray):
+        self.grid = grid
+        self.midpoints = (grid[1:] + grid[:-1]) / 2
+        self.compressor_on = compressor_on # Shape (ticks, grid points)
+        self.initial_costs = initial_costs
+
+    def grid_index(self, temperature):
+        """
+        The index of the nearest grid point of one or more temperatures
+
+        >>> OptimalPolicy(np.array([0.0, 1.0, 2.0]), np.zeros((1, 3), dtype=bool), np.zeros(3)).grid_index(np.array([0.4, 0.6, 9.0])).tolist()
+        [0, 1, 2]
+        """
+        return np.searchsorted(self.midpoints, temperature, side="right")
+
+    def decide(self, tick: int, temperature):
+        """
+        Whether the compressor should be on at the tick, for one or more temperatures
+        """
+        return self.compressor_on[tick, self.grid_index(temperature)]
+
+    def expected_cost(self, temperature: float = 5.0) -> float:
+        """
+        The minimum expected food loss and power expense of the horizon, starting at the temperature
+        """
+        return float(np.interp(temperature, self.grid, self.initial_costs))
+
+    def thresholds(self) -> np.ndarray:
+        """
+        A temperature cutoff per tick, above which the compressor is on, if the policy of every tick
+        is "on above some temperature". Otherwise None.
+        """
+        grid_count = len(self.grid)
+        any_on = self.compressor_on.any(axis=1)
+        first_on = np.argmax(self.compressor_on, axis=1)
+        on_count = np.count_nonzero(self.compressor_on, axis=1)
+        if np.any(any_on & (on_count != grid_count - first_on)):
+            return None
+        # On from grid point k means on from the midpoint below it, which grid_index rounds up to k
+        cutoffs = np.nextafter(self.midpoints[np.maximum(first_on - 1, 0)], -np.inf)
+        return np.where(any_on, np.where(first_on == 0, -np.inf, cutoffs), np.inf)
+
+def solve(power_prices: np.ndarray, physical_constants: physics.PhysicalConstants = None, door_probabilities=0.1, tick_seconds: int = 300,
+          grid_min: float = -2.0, grid_max: float = 14.0, grid_step: float = 0.01) -> OptimalPolicy:
+    """
+    Solves the dynamic program for the price series. door_probabilities is the probability of the door
+    being open, a single value or one per tick.
+
+    >>> policy = solve(np.zeros(10), grid_step=0.5) # Free power, so the compressor runs whenever it saves food
+    >>> policy.compressor_on.shape
+    (10, 33)
+    >>> bool(policy.decide(0, 10.0)), bool(policy.decide(0, 0.0)) # Cooling a room that is already too cold only adds food loss
+    (True, False)
+    """
+    physical_constants = physical_constants if physical_constants is not None else physics.PhysicalConstants()
+    power_prices = np.asarray(power_prices, dtype=float)
+    tick_count = len(power_prices)
+    door_probabilities = np.broadcast_to(np.asarray(door_probabilities, dtype=float), (tick_count,))
+    grid = np.arange(round((grid_max - grid_min) / grid_step) + 1) * grid_step + grid_min
+    slopes, offsets = physical_constants.transition_table(tick_seconds)
+
+    # The temperature after each of the four transitions, its food loss, and where it falls between grid points.
+    # They don't depend on the tick, so they are computed once.
+    next_temperatures = slopes[:, None] * grid + offsets[:, None]
+    food_loss_expenses = cooler_instance.calculate_food_loss_expenses(next_temperatures, tick_seconds)
+    power_expenses = power_prices * cooler_instance.expense_scale(tick_seconds)
+    positions = np.clip((next_temperatures - grid_min) / grid_step, 0, len(grid) - 1)
+    lower_indices = np.minimum(np.floor(positions).astype(np.int64), len(grid) - 2)
+    upper_weights = positions - lower_indices
+
+    compressor_on = np.zeros((tick_count, len(grid)), dtype=bool)
+    costs = np.zeros(len(grid)) # Minimum expected cost from the next tick to the end, per grid temperature
+    for tick in range(tick_count - 1, -1, -1):
+        # Expected cost after each transition, interpolated between grid points
+        after = food_loss_expenses + costs[lower_indices] * (1 - upper_weights) + costs[lower_indices + 1] * upper_weights
+        door_probability = door_probabilities[tick]
+        off_cost = (1 - door_probability) * after[0] + door_probability * after[2]
+        on_cost = power_expenses[tick] + (1 - door_probability) * after[1] + door_probability * after[3]
+        compressor_on[tick] = on_cost < off_cost
+        costs = np.minimum(on_cost, off_cost)
+
+    return OptimalPolicy(grid, compressor_on, costs)
+
+def solve_for_room(power_prices: np.ndarray, door_model: door_events.DoorModel = None, physical_constants: physics.PhysicalConstants = None,
+                   tick_seconds: int = 300, **grid) -> OptimalPolicy:
+    """
+    Solves the dynamic program with the door model, physics and tick length a cooler is simulated with
+    """
+    door_model = door_model if door_model is not None else door_events.BernoulliDoorModel()
+    return solve(power_prices, physical_constants, door_model.open_probabilities(len(power_prices)), tick_seconds, **grid)
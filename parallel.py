@@ -0,0 +1,176 @@
+"""
+Runs multi-month simulations on a pool of worker processes.
+
+The months are split into blocks of a fixed size, and every block gets its own random stream
+derived from the seed and the block index. The split doesn't depend on the amount of workers,
+so a run with a given seed gives the same result no matter how many workers are used.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, ExitStack
+from multiprocessing import shared_memory
+import os
+
+import numpy as np
+
+import cooler_instance as ci
+import scenarios
+
+# The power prices as seen by a worker process, attached from shared memory by _attach_power_prices
+_shared_memory = None
+_power_prices = None
+
+def block_rng(seed: int, block_index: int) -> np.random.Generator:
+    """
+    The random stream of a block of months. Only depends on the seed and the block index.
+
+    >>> float(block_rng(1, 3).random()) == float(block_rng(1, 3).random())
+    True
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(block_index,)))
+
+def split_into_blocks(simulation_steps: int, block_size: int) -> list:
+    """
+    Splits the months into (first month, month count) blocks
+
+    >>> split_into_blocks(5, 2)
+    [(0, 2), (2, 2), (4, 1)]
+    """
+    return [(start, min(block_size, simulation_steps - start)) for start in range(0, simulation_steps, block_size)]
+
+def simulate_block(thermostat, power_prices: np.ndarray, block_index: int, month_count: int, seed: int, cooler_options: dict = None,
+                   price_scenarios: scenarios.ScenarioGenerator = None, period_starts: np.ndarray = None) -> tuple:
+    """
+    Simulates one block of months with the batch engine, returns the food loss and power expenses per month.
+    cooler_options are extra keyword arguments for BatchCoolerInstance, e.g. door_model.
+    With price_scenarios, every month gets its own synthetic prices drawn from power_prices.
+    With period_starts, the expenses are (months, periods) arrays, see BatchCoolerInstance.simulate_periods.
+    """
+    if price_scenarios is not None:
+        power_prices = price_scenarios.generate(power_prices, month_count, scenarios.scenario_rng(seed, block_index))
+    batch_cooler = ci.BatchCoolerInstance(thermostat, power_prices, month_count, block_rng(seed, block_index), **(cooler_options or {}))
+    if period_starts is not None:
+        return batch_cooler.simulate_periods(period_starts)
+    return batch_cooler.simulate_month()
+
+def attach_power_prices(name: str, shape: tuple, dtype: str):
+    """
+    Worker initializer, gives the worker a view of the power prices in shared memory without copying them
+    """
+    global _shared_memory, _power_prices
+    _shared_memory = shared_memory.SharedMemory(name=name) # Unlinked by the parent process when the run is done
+    _power_prices = np.ndarray(shape, dtype=dtype, buffer=_shared_memory.buf)
+
+def worker_power_prices() -> np.ndarray:
+    """
+    The power prices attached by attach_power_prices, in a worker process
+    """
+    return _power_prices
+
+@contextmanager
+def shared_power_prices(power_prices: np.ndarray):
+    """
+    Copies the power prices into shared memory for the duration of the with block.
+    Yields the initargs for attach_power_prices.
+    """
+    power_prices = np.ascontiguousarray(power_prices, dtype=float)
+    shared_prices = shared_memory.SharedMemory(create=True, size=max(power_prices.nbytes, 1))
+    try:
+        np.ndarray(power_prices.shape, dtype=power_prices.dtype, buffer=shared_prices.buf)[...] = power_prices
+        yield (shared_prices.name, power_prices.shape, power_prices.dtype.str)
+    finally:
+        shared_prices.close()
+        shared_prices.unlink()
+
+def _simulate_shared_block(thermostat, block_index: int, month_count: int, seed: int, cooler_options: dict, price_scenarios, period_starts) -> tuple:
+    return simulate_block(thermostat, _power_prices, block_index, month_count, seed, cooler_options, price_scenarios, period_starts)
+
+class SimulationPool():
+    """
+    The worker processes of a run and the shared-memory copy of its power prices, created on first use and reused by
+    every call of simulate, so a run that simulates its months in rounds starts them only once. Workers also keep their
+    cached price features between rounds. Use it in a with block, which stops the workers and frees the shared memory.
+    workers=None uses all cores, workers=1 runs everything in this process.
+    """
+    def __init__(self, power_prices: np.ndarray, workers: int = None):
+        self.power_prices = power_prices
+        self.workers = os.cpu_count() if workers is None else workers
+        self._resources = ExitStack()
+        self._executor = None
+
+    def __enter__(self) -> "SimulationPool":
+        return self
+
+    def __exit__(self, *exc_info):
+        self._resources.close() # Stops the workers before the shared memory is freed
+
+    def executor(self) -> ProcessPoolExecutor:
+        """
+        The process pool, started the first time it is needed
+        """
+        if self._executor is None:
+            initargs = self._resources.enter_context(shared_power_prices(self.power_prices))
+            self._executor = self._resources.enter_context(ProcessPoolExecutor(max_workers=self.workers, initializer=attach_power_prices, initargs=initargs))
+        return self._executor
+
+    def simulate(self, thermostats: list, simulation_steps: int, seed: int = None, block_size: int = 1000, cooler_options: dict = None, first_block: int = 0,
+                 price_scenarios: scenarios.ScenarioGenerator = None, period_starts: np.ndarray = None) -> list:
+        """
+        Simulates simulation_steps months for every thermostat, see simulate_multiple_months_parallel
+
+        Months simulated in rounds are the months of a single call:
+
+        >>> import thermostat as therm
+        >>> with SimulationPool(np.ones(8640), workers=1) as pool:
+        ...     rounds = [pool.simulate([therm.SimpleThermostat()], 2, seed=7, block_size=2, first_block=block)[0][1] for block in range(2)]
+        >>> np.array_equal(np.concatenate(rounds), simulate_multiple_months_parallel([therm.SimpleThermostat()], np.ones(8640), 4, 1, 7, block_size=2)[0][1])
+        True
+        """
+        if seed is None:
+            seed = np.random.SeedSequence().entropy # Fresh entropy, shared by all blocks of this call
+        blocks = split_into_blocks(simulation_steps, block_size)
+        result_shape = (simulation_steps,) if period_starts is None else (simulation_steps, len(period_starts))
+        results = [(np.zeros(result_shape), np.zeros(result_shape)) for _ in thermostats]
+
+        def store(thermostat_index, block, values):
+            start, month_count = block
+            results[thermostat_index][0][start:start + month_count] = values[0]
+            results[thermostat_index][1][start:start + month_count] = values[1]
+
+        if self.workers <= 1 or len(blocks) * len(thermostats) <= 1:
+            for thermostat_index, thermostat in enumerate(thermostats):
+                for block_index, block in enumerate(blocks):
+                    store(thermostat_index, block, simulate_block(thermostat, self.power_prices, first_block + block_index, block[1], seed, cooler_options, price_scenarios, period_starts))
+            return results
+
+        executor = self.executor()
+        futures = {}
+        for thermostat_index, thermostat in enumerate(thermostats):
+            for block_index, block in enumerate(blocks):
+                future = executor.submit(_simulate_shared_block, thermostat, first_block + block_index, block[1], seed, cooler_options, price_scenarios, period_starts)
+                futures[future] = (thermostat_index, block)
+        for future, (thermostat_index, block) in futures.items():
+            store(thermostat_index, block, future.result())
+        return results
+
+def simulate_multiple_months_parallel(thermostats: list, power_prices: np.ndarray, simulation_steps: int, workers: int = None, seed: int = None, block_size: int = 1000, cooler_options: dict = None, first_block: int = 0,
+                                     price_scenarios: scenarios.ScenarioGenerator = None, period_starts: np.ndarray = None) -> list:
+    """
+    Simulates simulation_steps months for every thermostat, spread over a pool of workers.
+    Returns a (food expenses per month, power expenses per month) tuple per thermostat, in month order.
+    workers=None uses all cores, workers=1 runs everything in this process.
+    first_block is the index of the first block, to continue a run with the following months.
+    Every thermostat sees the same door events, and with price_scenarios the same prices, in the same month.
+    With period_starts, the expenses are (months, periods) arrays.
+    Runs that simulate their months in several calls should share a SimulationPool instead.
+
+    >>> import thermostat as therm
+    >>> first, second = simulate_multiple_months_parallel([therm.SimpleThermostat()] * 2, np.ones(8640), 3, workers=1, seed=7, block_size=2)
+    >>> np.array_equal(first[0], second[0]), first[1].shape
+    (True, (3,))
+    """
+    with SimulationPool(power_prices, workers) as pool:
+        return pool.simulate(thermostats, simulation_steps, seed, block_size, cooler_options, first_block, price_scenarios, period_starts)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,48 @@
+"""
+The physical constants of the cooler room, and the temperature update they give.
+
+Every tick, heat leaks in from outside through the walls (and the door, when it is open),
+and the compressor pulls the temperature towards its own temperature when it is on:
+
+    t = last_temp + (leak * (outside - last_temp) + compressor * (compressor_temp - last_temp)) * tick_seconds
+
+For each of the four (door open, compressor on) combinations this is an affine map t = a * last_temp + b,
+so the coefficients are computed once and looked up every tick.
+"""
+import numpy as np
+
+class PhysicalConstants():
+    """
+    Heat transfer constants of the cooler room. The defaults are the values the simulation has always used.
+    The constants can also be arrays with a value per room, e.g. for a fleet of rooms.
+    """
+    def __init__(self, outside_temperature: float = 20.0, compressor_temperature: float = -5.0,
+                 wall_coefficient: float = 0.0000005, door_coefficient: float = 0.00003, compressor_coefficient: float = 0.000008):
+        self.outside_temperature = outside_temperature
+        self.compressor_temperature = compressor_temperature
+        self.wall_coefficient = wall_coefficient # Heat transfer through the walls, when the door is closed
+        self.door_coefficient = door_coefficient # Heat transfer when the door is open
+        self.compressor_coefficient = compressor_coefficient
+
+    def transition_table(self, tick_seconds: int = 300) -> tuple:
+        """
+        The (a, b) coefficients of t = a * last_temp + b, as two arrays indexed by 2 * door_open + comp_on.
+        With constants per room, the arrays have shape (4, room count).
+
+        >>> slopes, offsets = PhysicalConstants().transition_table()
+        >>> bool(np.isclose(slopes[3] * 5.0 + offsets[3], 5.0 + (0.00003 * (20 - 5.0) + 0.000008 * (-5 - 5.0)) * 300))
+        True
+        >>> PhysicalConstants(outside_temperature=np.array([20.0, 25.0])).transition_table()[1].shape
+        (4, 2)
+        """
+        slopes = []
+        offsets = []
+        for door_open in (False, True):
+            for comp_on in (False, True): # Appended in the order of 2 * door_open + comp_on
+                leak = self.door_coefficient if door_open else self.wall_coefficient
+                cooling = self.compressor_coefficient if comp_on else 0.0
+                slopes.append(1 - (leak + cooling) * tick_seconds)
+                offsets.append((leak * self.outside_temperature + cooling * self.compressor_temperature) * tick_seconds)
+        room_shape = np.broadcast(*slopes, *offsets).shape # () for a single room
+        return (np.stack([np.broadcast_to(slope, room_shape) for slope in slopes]).astype(float),
+                np.stack([np.broadcast_to(offset, room_shape) for offset in offsets]).astype(float))
@@ -0,0 +1,118 @@
+"""
+Computes and caches features of a power price series, that some thermostats need on every tick.
+The power prices never change during a simulation, so the features are only computed once.
+"""
+from collections import OrderedDict
+import hashlib
+
+import numpy as np
+
+class PriceFeatureCache():
+    """
+    A small least-recently-used cache, so parameter sweeps don't grow memory without bound.
+    Limited both in entries and in bytes, since features of price scenarios are large (months, ticks) arrays.
+    A value larger than max_bytes is returned without being stored.
+    """
+    def __init__(self, max_entries: int = 32, max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+
+    def get(self, key: tuple, compute):
+        """
+        Returns the cached value for key, or computes it with compute() and stores it
+
+        >>> cache = PriceFeatureCache(max_entries=1)
+        >>> cache.get("a", lambda: 1), cache.get("a", lambda: 2), cache.get("b", lambda: 3), cache.get("a", lambda: 4)
+        (1, 1, 3, 4)
+        >>> cache = PriceFeatureCache(max_bytes=100)
+        >>> _ = cache.get("a", lambda: np.zeros(10)), cache.get("b", lambda: np.zeros(10))
+        >>> list(cache.entries), cache.total_bytes # Two arrays of 80 bytes don't fit
+        (['b'], 80)
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        value = compute()
+        value_bytes = getattr(value, "nbytes", 0)
+        if value_bytes > self.max_bytes:
+            return value
+        self.entries[key] = value
+        self.total_bytes += value_bytes
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False) # Evict the least recently used entry
+            self.total_bytes -= getattr(evicted, "nbytes", 0)
+        return value
+
+    def clear(self):
+        """
+        Removes everything from the cache
+        """
+        self.entries.clear()
+        self.total_bytes = 0
+
+def price_key(power_prices: np.ndarray) -> tuple:
+    """
+    Identifies a price series by its shape and a hash of its contents
+    """
+    power_prices = np.ascontiguousarray(power_prices, dtype=float)
+    return (power_prices.shape, hashlib.sha1(power_prices.tobytes()).hexdigest())
+
+def window_means(power_prices: np.ndarray, look_around: int, horizon: int = None) -> np.ndarray:
+    """
+    The mean price in the window [tick - look_around, tick + look_around) for every tick, using prefix sums.
+    The window is cut off at horizon, by default the end of the price series. Works on the last axis, so a 2D array of price series gives a 2D array of means.
+
+    >>> window_means(np.array([1.0, 2.0, 3.0, 4.0]), 1)
+    array([1. , 1.5, 2.5, 3.5])
+    """
+    power_prices = np.asarray(power_prices, dtype=float)
+    tick_count = power_prices.shape[-1]
+    ticks = np.arange(tick_count)
+    low_check = np.maximum(0, ticks - look_around)
+    hich_check = np.minimum(tick_count if horizon is None else min(horizon, tick_count), ticks + look_around)
+
+    prefix_sums = np.concatenate([np.zeros(power_prices.shape[:-1] + (1,)), np.cumsum(power_prices, axis=-1)], axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (prefix_sums[..., hich_check] - prefix_sums[..., low_check]) / (hich_check - low_check)
+
+def partition_cutoffs(power_prices: np.ndarray, partition_size: float, purchase_per_partition: int) -> np.ndarray:
+    """
+    The price of the purchase_per_partition'th cheapest tick in the partition of every tick.
+    Ticks in partitions with too few prices get -inf, so no price is cheap enough.
+
+    >>> partition_cutoffs(np.array([4.0, 1.0, 3.0, 2.0, 5.0]), 2, 2)
+    array([  4.,   4.,   3.,   3., -inf])
+    """
+    power_prices = np.asarray(power_prices, dtype=float)
+    tick_count = power_prices.shape[-1]
+    cutoffs = np.full(power_prices.shape, -np.inf)
+    partition_indices = (np.arange(tick_count) // partition_size).astype(int)
+
+    for partition_index in np.unique(partition_indices):
+        partition_start = int(partition_index * partition_size)
+        partition_end = min(int(partition_start + partition_size), tick_count)
+        partition_sliced_array = power_prices[..., partition_start:partition_end]
+        if partition_sliced_array.shape[-1] < purchase_per_partition:
+            continue
+        lowest_price = np.partition(partition_sliced_array, purchase_per_partition - 1, axis=-1)[..., purchase_per_partition - 1]
+        cutoffs[..., partition_indices == partition_index] = lowest_price[..., np.newaxis]
+    return cutoffs
+
+_cache = PriceFeatureCache()
+
+def get_window_means(power_prices: np.ndarray, look_around: int, horizon: int = None) -> np.ndarray:
+    """
+    Cached version of window_means
+    """
+    key = ("window_means", price_key(power_prices), look_around, horizon)
+    return _cache.get(key, lambda: window_means(power_prices, look_around, horizon))
+
+def get_partition_cutoffs(power_prices: np.ndarray, partition_size: float, purchase_per_partition: int) -> np.ndarray:
+    """
+    Cached version of partition_cutoffs
+    """
+    key = ("partition_cutoffs", price_key(power_prices), partition_size, purchase_per_partition)
+    return _cache.get(key, lambda: partition_cutoffs(power_prices, partition_size, purchase_per_partition))
@@ -0,0 +1,136 @@
+"""
+A binary store for power price histories.
+The CSV is parsed once and saved as .npy files with the timestamps and prices, which are memory-mapped
+on later loads. The cache is rebuilt when the size or modification time of the CSV changes.
+"""
+import json
+import os
+
+import numpy as np
+
+STORE_VERSION = 1
+
+class PriceStore():
+    """
+    Timestamps and prices of a power price history. Slicing a date range gives views, not copies.
+    """
+    def __init__(self, timestamps: np.ndarray, prices: np.ndarray):
+        self.timestamps = timestamps # datetime64[s], NaT if the CSV time column isn't a date
+        self.prices = prices
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    @classmethod
+    def open(cls, csv_path: str, cache_dir: str = None) -> "PriceStore":
+        """
+        Opens the store of a CSV file with a time and a price column, converting it first if needed
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(csv_path)), ".price_cache")
+        base_path = os.path.join(cache_dir, os.path.basename(csv_path))
+        timestamps_path = base_path + ".timestamps.npy"
+        prices_path = base_path + ".prices.npy"
+        meta_path = base_path + ".meta.json"
+
+        source_stat = os.stat(csv_path)
+        source_meta = {"version": STORE_VERSION, "size": source_stat.st_size, "mtime_ns": source_stat.st_mtime_ns}
+
+        if not _cache_is_valid(meta_path, source_meta):
+            timestamps, prices = parse_price_csv(csv_path)
+            os.makedirs(cache_dir, exist_ok=True)
+            _save_atomically(timestamps_path, timestamps)
+            _save_atomically(prices_path, prices)
+            with open(meta_path + ".tmp", "w", encoding="utf-8") as file:
+                json.dump(source_meta, file)
+            os.replace(meta_path + ".tmp", meta_path) # The meta file is written last, so it only exists for complete caches
+
+        return cls(np.load(timestamps_path, mmap_mode="r"), np.load(prices_path, mmap_mode="r"))
+
+    def tick_seconds(self) -> int:
+        """
+        The length of a tick in seconds, from the timestamps. 300 if they aren't dates.
+        """
+        if len(self) < 2 or np.isnat(self.timestamps[0]) or np.isnat(self.timestamps[1]):
+            return 300
+        return int(np.median(np.diff(self.timestamps[:1000]).astype("timedelta64[s]").astype(np.int64)))
+
+    def start_seconds(self) -> int:
+        """
+        The time of day of the first tick, in seconds after midnight. 0 if the timestamps aren't dates.
+
+        >>> PriceStore(np.array(["2022-09-01T06:30"], dtype="datetime64[s]"), np.zeros(1)).start_seconds()
+        23400
+        """
+        if len(self) == 0 or np.isnat(self.timestamps[0]):
+            return 0
+        first = self.timestamps[0]
+        return int((first - first.astype("datetime64[D]")).astype("timedelta64[s]").astype(np.int64))
+
+    def period_starts(self, period: str = None) -> np.ndarray:
+        """
+        The first tick of every "MONTH" or "DAY" in the store. None gives a single period.
+        If the timestamps aren't dates, a day is 86400 seconds of ticks and a month 30 days.
+
+        >>> store = PriceStore(np.array(["2022-09-30T12:00", "2022-10-01T00:00", "2022-10-01T12:00"], dtype="datetime64[s]"), np.zeros(3))
+        >>> store.period_starts("DAY")
+        array([0, 1])
+        """
+        if period is None:
+            return np.array([0])
+        units = {"MONTH": "M", "DAY": "D"}
+        if period not in units:
+            raise ValueError(f"Invalid period: {period}")
+        if len(self) == 0 or np.isnat(self.timestamps[0]):
+            period_days = 30 if period == "MONTH" else 1
+            return np.arange(0, len(self), period_days * 86400 // self.tick_seconds())
+        periods = np.asarray(self.timestamps).astype(f"datetime64[{units[period]}]")
+        return np.flatnonzero(np.concatenate([[True], periods[1:] != periods[:-1]]))
+
+    def slice(self, start: str = None, end: str = None) -> "PriceStore":
+        """
+        The prices from start (inclusive) to end (exclusive), as views of this store
+
+        >>> store = PriceStore(np.array(["2022-09-01T00:00", "2022-09-01T00:05", "2022-09-01T00:10"], dtype="datetime64[s]"), np.array([1.0, 2.0, 3.0]))
+        >>> store.slice("2022-09-01T00:05").prices
+        array([2., 3.])
+        >>> store.slice(end="2022-09-01T00:05").prices
+        array([1.])
+        """
+        first = 0 if start is None else int(np.searchsorted(self.timestamps, np.datetime64(start, "s"), side="left"))
+        last = len(self) if end is None else int(np.searchsorted(self.timestamps, np.datetime64(end, "s"), side="left"))
+        return PriceStore(self.timestamps[first:last], self.prices[first:last])
+
+def parse_price_csv(csv_path: str) -> tuple:
+    """
+    Reads a CSV with a header row, a time column and a price column. Returns the timestamps and prices.
+    """
+    time_strings = []
+    prices = []
+    with open(csv_path, "r", encoding="utf-8") as file:
+        next(file) # Skip the header
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            time_string, price_string = line.split(",")[:2]
+            time_strings.append(time_string.strip())
+            prices.append(float(price_string))
+
+    try:
+        timestamps = np.array(time_strings, dtype="datetime64[s]")
+    except ValueError:
+        timestamps = np.full(len(time_strings), np.datetime64("NaT"), dtype="datetime64[s]")
+    return timestamps, np.array(prices, dtype=float)
+
+def _cache_is_valid(meta_path: str, source_meta: dict) -> bool:
+    try:
+        with open(meta_path, "r", encoding="utf-8") as file:
+            return json.load(file) == source_meta
+    except (OSError, ValueError):
+        return False
+
+def _save_atomically(path: str, array: np.ndarray):
+    with open(path + ".tmp", "wb") as file:
+        np.save(file, array)
+    os.replace(path + ".tmp", path)
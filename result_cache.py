@@ -0,0 +1,174 @@
+"""
+A content-addressed cache of simulation results on disk.
+
+A result is identified by a hash of everything it depends on: the power prices, the thermostat type and
+its parameters, the cooler options (door model, physics, tick length), the seed and the block size.
+With price scenarios, the scenario generator is part of the key too. The month count is not part of the key. Multi-month results are stored per block of months, as a .npy file
+with a food loss and a power column, memory-mapped on read, so a longer run with the same key only simulates
+the blocks that are missing. Per-tick traces of single runs are stored compressed.
+The least recently used files are evicted when the cache grows beyond its size limit.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import parallel
+import price_features
+import sweep
+
+CACHE_VERSION = 1 # Part of every key, raise it when a change to the engines changes the results
+
+TRACE_NAMES = ("food_loss_expenses", "power_expenses", "temperature_history", "door_state_history", "compressor_state_history")
+
+class ResultCache():
+    """
+    Stores the results of simulations in cache_dir, using at most max_bytes of disk
+    """
+    def __init__(self, cache_dir: str = ".result_cache", max_bytes: int = 1 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(thermostat, power_prices: np.ndarray, seed, batch_size: int = None, cooler_options: dict = None, kind: str = "months",
+            price_scenarios=None, period_starts: np.ndarray = None) -> str:
+        """
+        The hash of everything a result depends on, except the month count
+
+        >>> import thermostat as therm
+        >>> ResultCache.key(therm.SimpleThermostat(), np.ones(3), 1) == ResultCache.key(therm.SimpleThermostat(), np.ones(3), 2)
+        False
+        """
+        description = [
+            CACHE_VERSION,
+            kind,
+            type(thermostat).__name__,
+            sorted((name, sweep.describe_option(value)) for name, value in thermostat.get_parameters().items() if not callable(value)), # Leaves out instrumented methods
+            price_features.price_key(power_prices)[1],
+            sorted((name, sweep.describe_option(value)) for name, value in (cooler_options or {}).items()),
+            seed,
+            batch_size,
+        ]
+        if price_scenarios is not None: # Left out otherwise, so results cached without scenarios keep their keys
+            description.append(sweep.describe_option(price_scenarios))
+        if period_starts is not None:
+            description.append(["periods", np.asarray(period_starts).tolist()])
+        return hashlib.sha256(json.dumps(description, default=str).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str, file_name: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key, file_name)
+
+    def get_block(self, key: str, block_index: int, month_count: int):
+        """
+        The (2, month_count) array of food loss and power expenses of a block, memory-mapped, or None.
+        (2, month_count, periods) for expenses per period.
+        """
+        path = self._path(key, f"block_{block_index}_{month_count}.npy")
+        if not os.path.exists(path):
+            return None
+        os.utime(path) # Marks the file as recently used
+        return np.load(path, mmap_mode="r")
+
+    def put_block(self, key: str, block_index: int, food_expenses: np.ndarray, power_expenses: np.ndarray):
+        """
+        Stores the expenses of a block
+        """
+        path = self._path(key, f"block_{block_index}_{len(food_expenses)}.npy")
+        _save_atomically(path, lambda file: np.save(file, np.stack([food_expenses, power_expenses])))
+
+    def get_trace(self, key: str):
+        """
+        The per-tick arrays of a single run, in the order simulate_month returns them, or None
+        """
+        path = self._path(key, "trace.npz")
+        if not os.path.exists(path):
+            return None
+        os.utime(path)
+        with np.load(path) as trace:
+            return tuple(trace[name] for name in TRACE_NAMES)
+
+    def put_trace(self, key: str, values: tuple):
+        """
+        Stores the per-tick arrays of a single run, compressed
+        """
+        _save_atomically(self._path(key, "trace.npz"), lambda file: np.savez_compressed(file, **dict(zip(TRACE_NAMES, values))))
+
+    def evict(self):
+        """
+        Deletes the least recently used files until the cache fits in max_bytes
+        """
+        files = []
+        for directory, _, file_names in os.walk(self.cache_dir):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime_ns, stat.st_size, path))
+        total_bytes = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total_bytes <= self.max_bytes:
+                break
+            os.remove(path)
+            total_bytes -= size
+
+def _save_atomically(path: str, write):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as file:
+        write(file)
+    os.replace(path + ".tmp", path)
+
+def simulate_multiple_months_cached(cache: ResultCache, thermostats: list, power_prices: np.ndarray, simulation_steps: int, workers: int = 1,
+                                    seed: int = 0, block_size: int = 1000, cooler_options: dict = None, price_scenarios=None,
+                                    period_starts: np.ndarray = None) -> list:
+    """
+    Same as parallel.simulate_multiple_months_parallel with a fixed seed, but only simulates the blocks that aren't cached.
+    Gives the same results as an uncached run.
+    """
+    blocks = parallel.split_into_blocks(simulation_steps, block_size)
+    results = []
+    for thermostat in thermostats:
+        key = ResultCache.key(thermostat, power_prices, seed, block_size, cooler_options, price_scenarios=price_scenarios, period_starts=period_starts)
+        result_shape = (simulation_steps,) if period_starts is None else (simulation_steps, len(period_starts))
+        food_expenses = np.zeros(result_shape)
+        power_expenses = np.zeros(result_shape)
+        missing = []
+        for block_index, (start, month_count) in enumerate(blocks):
+            values = cache.get_block(key, block_index, month_count)
+            if values is None:
+                missing.append(block_index)
+            else:
+                food_expenses[start:start + month_count] = values[0]
+                power_expenses[start:start + month_count] = values[1]
+
+        # Consecutive missing blocks are simulated in one go. Only the last block can be partial, so they split the same way.
+        while missing:
+            run_length = 1
+            while run_length < len(missing) and missing[run_length] == missing[0] + run_length:
+                run_length += 1
+            run_blocks = [blocks[block_index] for block_index in missing[:run_length]]
+            first_month = run_blocks[0][0]
+            month_count = sum(count for _, count in run_blocks)
+            run_food, run_power = parallel.simulate_multiple_months_parallel([thermostat], power_prices, month_count, workers, seed, block_size,
+                                                                             cooler_options, missing[0], price_scenarios, period_starts)[0]
+            food_expenses[first_month:first_month + month_count] = run_food
+            power_expenses[first_month:first_month + month_count] = run_power
+            for block_index, (start, count) in zip(missing[:run_length], run_blocks):
+                cache.put_block(key, block_index, food_expenses[start:start + count], power_expenses[start:start + count])
+            missing = missing[run_length:]
+
+        results.append((food_expenses, power_expenses))
+    cache.evict()
+    return results
+
+def result_cache_from_config(cache_config: dict):
+    """
+    Builds the ResultCache of the result_cache section of the config, or None if it is disabled
+
+    >>> result_cache_from_config({"enabled": True, "max_megabytes": 2}).max_bytes
+    2097152
+    >>> result_cache_from_config(None) is None
+    True
+    """
+    if not cache_config or not cache_config.get("enabled", False):
+        return None
+    return ResultCache(cache_config.get("path", ".result_cache"), int(cache_config.get("max_megabytes", 1024) * 1024 * 1024))
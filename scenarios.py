@@ -0,0 +1,109 @@
+"""
+Generates synthetic power price months from the historical price series, so simulations can cover
+price uncertainty as well as door randomness.
+
+Both methods build a scenario from whole days of the history, so prices stay at their time of day:
+    BLOCK: a block bootstrap, which glues together runs of block_days consecutive days starting at random days
+    WEEKDAY: every day of the scenario is a random day of the history on the same weekday
+Scenarios are generated as a (scenarios, ticks) array with index arithmetic, without a loop per scenario.
+"""
+import numpy as np
+
+class ScenarioGenerator():
+    """
+    Draws price scenarios from a price history. first_weekday is the weekday of the first tick of the
+    history (Monday is 0), and scenarios start on the same weekday.
+    """
+    def __init__(self, method: str = "BLOCK", block_days: int = 3, tick_seconds: int = 300, first_weekday: int = 0):
+        if method not in ("BLOCK", "WEEKDAY"):
+            raise ValueError(f"Invalid scenario method: {method}")
+        self.method = method
+        self.block_days = block_days
+        self.ticks_per_day = 86400 // tick_seconds
+        self.first_weekday = first_weekday
+
+    def generate(self, history: np.ndarray, scenario_count: int, rng: np.random.Generator, tick_count: int = None) -> np.ndarray:
+        """
+        scenario_count scenarios of tick_count ticks (by default the length of the history), shape (scenario_count, tick_count)
+
+        >>> history = np.repeat(np.arange(14.0), 2) # Two ticks per day for 14 days, every day has its own price
+        >>> generator = ScenarioGenerator("WEEKDAY", tick_seconds=43200)
+        >>> scenarios = generator.generate(history, 3, np.random.default_rng(0))
+        >>> scenarios.shape
+        (3, 28)
+        >>> bool(np.all(scenarios[:, ::2] % 7 == np.arange(14) % 7)) # Every day comes from the same weekday
+        True
+        """
+        history = np.asarray(history, dtype=float)
+        tick_count = len(history) if tick_count is None else tick_count
+        history_days = len(history) // self.ticks_per_day
+        if history_days < 1:
+            raise ValueError("The price history is shorter than a day")
+        scenario_days = -(-tick_count // self.ticks_per_day)
+
+        if self.method == "BLOCK":
+            block_count = -(-scenario_days // self.block_days)
+            block_starts = rng.integers(0, history_days, (scenario_count, block_count))
+            source_days = (block_starts[:, :, None] + np.arange(self.block_days)).reshape(scenario_count, -1)[:, :scenario_days] % history_days
+        else:
+            source_days = self.same_weekday_days(history_days, scenario_count, scenario_days, rng)
+
+        tick_indices = source_days[:, :, None] * self.ticks_per_day + np.arange(self.ticks_per_day)
+        return history[tick_indices.reshape(scenario_count, -1)[:, :tick_count]]
+
+    def same_weekday_days(self, history_days: int, scenario_count: int, scenario_days: int, rng: np.random.Generator) -> np.ndarray:
+        """
+        A random history day for every scenario day, on the same weekday as the scenario day, shape (scenario_count, scenario_days)
+        """
+        history_weekdays = (self.first_weekday + np.arange(history_days)) % 7
+        candidates = [np.flatnonzero(history_weekdays == weekday) for weekday in range(7)]
+        candidate_counts = np.array([len(days) for days in candidates])
+        candidate_table = np.zeros((7, max(candidate_counts.max(), 1)), dtype=np.int64)
+        for weekday, days in enumerate(candidates):
+            candidate_table[weekday, :len(days)] = days
+
+        scenario_weekdays = (self.first_weekday + np.arange(scenario_days)) % 7
+        if np.any(candidate_counts[scenario_weekdays] == 0):
+            raise ValueError("The price history needs at least one day of every weekday for the WEEKDAY method")
+        picks = (rng.random((scenario_count, scenario_days)) * candidate_counts[scenario_weekdays]).astype(np.int64)
+        return candidate_table[scenario_weekdays, picks]
+
+    def chunks(self, history: np.ndarray, scenario_count: int, chunk_size: int, rng: np.random.Generator, tick_count: int = None):
+        """
+        Yields scenario_count scenarios in arrays of at most chunk_size scenarios, so they never all are in memory
+
+        >>> generator = ScenarioGenerator(block_days=1, tick_seconds=43200)
+        >>> [len(chunk) for chunk in generator.chunks(np.arange(8.0), 5, 2, np.random.default_rng(0))]
+        [2, 2, 1]
+        """
+        for start in range(0, scenario_count, chunk_size):
+            yield self.generate(history, min(chunk_size, scenario_count - start), rng, tick_count)
+
+def first_weekday(timestamps: np.ndarray) -> int:
+    """
+    The weekday (Monday is 0) of the first timestamp, 0 if the timestamps aren't dates
+
+    >>> first_weekday(np.array(["2022-09-01T00:00"], dtype="datetime64[s]")) # A Thursday
+    3
+    """
+    if len(timestamps) == 0 or np.isnat(timestamps[0]):
+        return 0
+    return int((timestamps[0].astype("datetime64[D]").astype(np.int64) + 3) % 7) # 1970-01-01 was a Thursday
+
+def scenario_rng(seed: int, block_index: int) -> np.random.Generator:
+    """
+    The random stream of the price scenarios of a block of months, independent of its door events (see parallel.block_rng)
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(block_index, 1)))
+
+def scenario_generator_from_config(scenario_config: dict, tick_seconds: int = 300, timestamps: np.ndarray = None):
+    """
+    Builds the ScenarioGenerator of the price_scenarios section of the config, or None if it is disabled
+
+    >>> scenario_generator_from_config({"enabled": True, "method": "WEEKDAY"}).method
+    'WEEKDAY'
+    """
+    if not scenario_config or not scenario_config.get("enabled", False):
+        return None
+    weekday = first_weekday(timestamps) if timestamps is not None else 0
+    return ScenarioGenerator(scenario_config.get("method", "BLOCK"), scenario_config.get("block_days", 3), tick_seconds, weekday)
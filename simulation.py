@@ -1,12 +1,34 @@
 """
 Main program. This program runs a simulation
+
+    python simulation.py # runs what config.yaml describes
+    python simulation.py compare SIMPLE PARTITION --set simulation_steps=500
+    python simulation.py sweep --config other.yaml
+    python simulation.py live --set fleet.room_count=1000
+    python simulation.py bench --trials 3
 """
+import argparse
+import asyncio
+import itertools
+import sys
 import yaml
 import time
 
 import numpy as np
 
+import comparison
 import cooler_instance as ci
+import door_events
+import fleet
+import instrumentation
+import live
+import parallel
+import physics
+import price_store
+import result_cache
+import scenarios
+import streaming
+import sweep
 import thermostat as therm
 import visualisation as vis
 
@@ -24,16 +46,45 @@ def load_config(path: str) -> dict:
         print(f"Error reading YAML file: {e}")
 
 
-def load_power_prices(path: str) -> np.array:
+def apply_overrides(config: dict, overrides: list) -> dict:
+    """
+    Applies "key=value" overrides to the config. Nested keys are separated by dots, values are read as YAML.
+
+    >>> apply_overrides({"simulation_steps": 100, "sweep": {"method": "GRID"}}, ["simulation_steps=500", "sweep.method=HALVING"])
+    {'simulation_steps': 500, 'sweep': {'method': 'HALVING'}}
+    """
+    for override in overrides:
+        if "=" not in override:
+            raise ValueError(f"Invalid override, expected key=value: {override}")
+        key, value = override.split("=", 1)
+        *parents, name = key.strip().split(".")
+        section = config
+        for parent in parents:
+            section = section.setdefault(parent, {})
+        section[name] = yaml.safe_load(value)
+    return config
+
+def load_price_store(path: str, start: str = None, end: str = None) -> price_store.PriceStore:
+    """
+    Opens the price history at the given path, limited to the date range.
+    Without a date range the last row is left out, as elpris.csv ends with the first tick of the next month.
+    """
+    store = price_store.PriceStore.open(path)
+    if start is None and end is None:
+        return price_store.PriceStore(store.timestamps[:-1], store.prices[:-1])
+    return store.slice(start, end)
+
+def load_power_prices(path: str, start: str = None, end: str = None) -> np.array:
     """
-    Reads the power price history from the given path
+    Reads the power price history from the given path, through the binary price store.
+    Without a date range the last row is left out, as elpris.csv ends with the first tick of the next month.
 
     >>> np.savetxt("test_prices.csv", np.array([[0, 10.0], [1, 20.0], [2, 30.0]]), delimiter=',', header='Time,Price', comments='')
     >>> load_power_prices("test_prices.csv")
     array([10., 20.])
     """
     try:
-        return np.genfromtxt(path, skip_header=1, skip_footer=1, usecols=1, dtype=float, delimiter=',')
+        return np.asarray(load_price_store(path, start, end).prices) # A plain array view of the memory-mapped prices
     except (OSError, ValueError) as e:
         print(f"Error reading CSV: {e}")
 
@@ -51,53 +102,257 @@ def instantiate_thermostat_from_enum(enum_value: str) -> therm.Thermostat:
     except KeyError as exc:
         raise ValueError(f"Invalid ThermostatType: {enum_value}") from exc
 
-def simulate_multiple_months(target_cooler, simulation_steps: int) -> tuple:
-    food_expenses_per_month = np.zeros(simulation_steps, dtype=float)
-    power_expenses_per_month = np.zeros(simulation_steps, dtype=float)
+def simulate_multiple_months(target_cooler, simulation_steps: int, price_scenarios: scenarios.ScenarioGenerator = None, scenario_seed=None,
+                             period_starts: np.ndarray = None) -> tuple:
+    result_shape = (simulation_steps,) if period_starts is None else (simulation_steps, len(period_starts))
+    food_expenses_per_month = np.zeros(result_shape, dtype=float)
+    power_expenses_per_month = np.zeros(result_shape, dtype=float)
+    price_history = target_cooler.power_prices
+    if price_scenarios is not None:
+        # Coolers given the same scenario_seed see the same prices in the same month
+        month_prices = itertools.chain.from_iterable(price_scenarios.chunks(price_history, simulation_steps, 1000, np.random.default_rng(scenario_seed)))
     
     counter = 0
     while counter < simulation_steps:
-        values = target_cooler.simulate_month(False)
+        if price_scenarios is not None:
+            target_cooler.power_prices = next(month_prices)
+        values = target_cooler.simulate_month(False) if period_starts is None else target_cooler.simulate_periods(period_starts)
         food_expenses_per_month[counter] = values[0]
         power_expenses_per_month[counter] = values[1]
         counter += 1
+    target_cooler.power_prices = price_history
     
     return food_expenses_per_month, power_expenses_per_month
 
-def run_simulation():
-    print("Reading config from config.yaml...")
-    config = load_config("config.yaml") # Loads 'config.yaml'
+def run_multiple_months(config: dict, coolers: list, power_prices: np.array, cooler_options: dict, cache: result_cache.ResultCache = None,
+                        price_scenarios: scenarios.ScenarioGenerator = None, period_starts: np.ndarray = None) -> list:
+    """
+    Runs the multi-month simulation for every cooler with the engine selected in the config.
+    With a cache and a seed, the batch engine only simulates the months that aren't cached.
+    With price_scenarios, every month has its own synthetic prices, the same for every cooler.
+    Returns a (food expenses per month, power expenses per month) tuple per cooler, (months, periods) arrays with period_starts.
+    """
+    if config.get("batch_simulation", True):
+        thermostats = [cooler.thermostat_instance for cooler in coolers]
+        if cache is not None and config.get("seed") is not None:
+            return result_cache.simulate_multiple_months_cached(cache, thermostats, power_prices, config["simulation_steps"], config.get("workers", 1), config["seed"], config.get("batch_size", 1000), cooler_options, price_scenarios, period_starts)
+        return parallel.simulate_multiple_months_parallel(thermostats, power_prices, config["simulation_steps"], config.get("workers", 1), config.get("seed"), config.get("batch_size", 1000), cooler_options,
+                                                          price_scenarios=price_scenarios, period_starts=period_starts)
+    scenario_seed = np.random.SeedSequence(config.get("seed")).entropy
+    return [simulate_multiple_months(cooler, config["simulation_steps"], price_scenarios, scenario_seed, period_starts) for cooler in coolers]
+
+def print_period_expenses(prices: price_store.PriceStore, period: str, period_starts: np.ndarray, expenses: np.ndarray, label: str = ""):
+    """
+    Prints the expense of every period. expenses has a value per period, or a row of them per month, then the mean over the months is printed.
+    """
+    mean_expenses = np.mean(np.atleast_2d(expenses), axis=0)
+    for period_start, expense in zip(period_starts, mean_expenses):
+        print(f"{label}{period.capitalize()} starting {prices.timestamps[period_start]}: {round(float(expense), 2)} kr.")
+
+def total_per_month(expenses: np.ndarray) -> np.ndarray:
+    """
+    The total of every month, from its expenses per period (or its total, which is returned as is)
+
+    >>> total_per_month(np.array([[1.0, 2.0], [3.0, 4.0]]))
+    array([3., 7.])
+    """
+    return np.sum(expenses, axis=1) if np.ndim(expenses) == 2 else expenses
+
+def trace_seed(seed, cooler_index: int):
+    """
+    Identifies the random stream of one of the coolers of a run with the seed, for the trace cache. None if the run has no seed.
+
+    >>> trace_seed(7, 1), trace_seed(None, 1)
+    ([7, 1], None)
+    """
+    return None if seed is None else [seed, cooler_index]
+
+def simulate_month_cached(cooler: ci.CoolerInstance, cache: result_cache.ResultCache, seed, cooler_options: dict) -> tuple:
+    """
+    cooler.simulate_month(True), with the per-tick results taken from the cache if they are there.
+    seed identifies the random stream of the cooler. Without a cache or a seed, the month is simulated.
+
+    >>> import tempfile
+    >>> cache = result_cache.ResultCache(tempfile.mkdtemp())
+    >>> first, second = [simulate_month_cached(ci.CoolerInstance(therm.SimpleThermostat(), np.ones(8640)), cache, trace_seed(None, 0), None) for _ in range(2)]
+    >>> np.array_equal(first[2], second[2]) # Unseeded runs have different door events, so nothing is cached
+    False
+    """
+    if cache is None or seed is None:
+        return cooler.simulate_month(True)
+    key = result_cache.ResultCache.key(cooler.thermostat_instance, cooler.power_prices, seed, cooler_options=cooler_options, kind="trace")
+    values = cache.get_trace(key)
+    if values is None:
+        values = cooler.simulate_month(True)
+        cache.put_trace(key, values)
+        cache.evict()
+    return values
+
+def uses_scalar_engine(config: dict) -> bool:
+    """
+    Whether the run selected in the config simulates with CoolerInstance, the engine that can be instrumented
+
+    >>> uses_scalar_engine({"simulate_multiple_months": False})
+    True
+    >>> uses_scalar_engine({"simulate_multiple_months": True, "comparison_simulation": False, "batch_simulation": True})
+    False
+    """
+    if any(config.get(section, {}).get("enabled", False) for section in ["sweep", "fleet", "branching", "live"]):
+        return False
+    if not config["simulate_multiple_months"]:
+        return True
+    if config.get("comparison_simulation") and config.get("paired_comparison", False):
+        return False
+    if not config.get("comparison_simulation") and config.get("streaming", False):
+        return False
+    return not config.get("batch_simulation", True)
+
+def run_simulation(config: dict = None):
+    if config is None:
+        print("Reading config from config.yaml...")
+        config = load_config("config.yaml") # Loads 'config.yaml'
 
     print("Reading power prices...")
-    power_prices = load_power_prices("elpris.csv")
+    prices = load_price_store(config.get("price_file", "elpris.csv"), config.get("price_start"), config.get("price_end"))
+    power_prices = np.asarray(prices.prices)
+    tick_seconds = prices.tick_seconds()
 
     print("Instantiating classes...")
+    door_model = door_events.door_model_from_config(config.get("door_model"), tick_seconds, prices.start_seconds())
+    physical_constants = physics.PhysicalConstants(**config.get("physics", {}))
+    cooler_options = {"door_model": door_model, "tick_seconds": tick_seconds, "physical_constants": physical_constants}
+    price_scenarios = scenarios.scenario_generator_from_config(config.get("price_scenarios"), tick_seconds, prices.timestamps)
+    result_period = config.get("result_period")
+    period_starts = prices.period_starts(result_period) if result_period is not None else None
+    first_seed, second_seed = np.random.SeedSequence(config.get("seed")).spawn(2) # Independent door events for the two coolers
     thermostat = instantiate_thermostat_from_enum(config["thermostat_type"])()
-    cooler = ci.CoolerInstance(thermostat, power_prices)
+    cooler = ci.CoolerInstance(thermostat, power_prices, door_model, np.random.default_rng(first_seed), tick_seconds=tick_seconds, physical_constants=physical_constants)
     if config["comparison_simulation"]:
         second_thermostat = instantiate_thermostat_from_enum(config["second_thermostat_type"])()
-        second_cooler = ci.CoolerInstance(second_thermostat, power_prices)
+        second_cooler = ci.CoolerInstance(second_thermostat, power_prices, door_model, np.random.default_rng(second_seed), tick_seconds=tick_seconds, physical_constants=physical_constants)
 
-    if config["simulate_multiple_months"]:
-        if config["comparison_simulation"]:
+    renderer = vis.renderer_from_config(config.get("visualisation"))
+    cache = result_cache.result_cache_from_config(config.get("result_cache"))
+    if cache is not None and config.get("seed") is None:
+        print("The result cache needs a seed, results are not cached")
+    trace_cache = cache if cache is not None and config.get("seed") is not None and config["result_cache"].get("traces", False) else None
+    profiler = None
+    if config.get("instrumentation", False):
+        if uses_scalar_engine(config):
+            profiler = instrumentation.Instrumentation()
+            profiler.instrument_cooler(cooler, config["thermostat_type"])
+            if config["comparison_simulation"]:
+                second_label = config["second_thermostat_type"]
+                if second_label == config["thermostat_type"]:
+                    second_label += " (second)"
+                profiler.instrument_cooler(second_cooler, second_label)
+        else:
+            print("Instrumentation only covers the scalar engine: single runs, and multi-month runs with batch_simulation FALSE")
+
+    if config.get("live", {}).get("enabled", False):
+        print(f"Running live controllers for {config.get('fleet', {}).get('room_count', 1000)} rooms on a replay of {config.get('price_file', 'elpris.csv')}...")
+        start_time = time.time()
+        site = fleet.fleet_from_config(config.get("fleet", {}), power_prices, physical_constants, tick_seconds, config.get("seed"))
+        feed = live.ReplayFeed(site, config["live"].get("interval_seconds", 0.0))
+        latency = asyncio.run(live.LiveController(site.thermostats, site.assignment).run(feed))
+        elapsed_time = time.time() - start_time
+        print(feed.result.summary())
+        print(latency.summary())
+        print(f"Took {round(elapsed_time, 2)} seconds")
+
+    elif config.get("fleet", {}).get("enabled", False):
+        print(f"Running fleet of {config['fleet'].get('room_count', 1000)} rooms...")
+        start_time = time.time()
+        site = fleet.fleet_from_config(config["fleet"], power_prices, physical_constants, tick_seconds, config.get("seed"))
+        result = site.simulate_month()
+        elapsed_time = time.time() - start_time
+        print(result.summary())
+        print(f"Took {round(elapsed_time, 2)} seconds")
+        renderer.plot("fleet_curves", vis.plot_fleet_curves, result.compressor_load, result.power_expenses, power_prices)
+
+    elif config.get("branching", {}).get("enabled", False):
+        branch_day = config["branching"].get("branch_day", 20)
+        branch_tick = min(len(power_prices), int(branch_day * 86400 // tick_seconds))
+        branch_types = config["branching"].get("thermostat_types", [config["thermostat_type"]])
+        print(f"Running {config['thermostat_type']} until day {branch_day}, then branching into {', '.join(branch_types)}...")
+        start_time = time.time()
+        branch_cooler = ci.CoolerInstance(thermostat, power_prices, door_model, np.random.default_rng(first_seed), record_history=False,
+                                          tick_seconds=tick_seconds, physical_constants=physical_constants)
+        branches = ci.simulate_branches(branch_cooler, branch_tick, [instantiate_thermostat_from_enum(branch_type)() for branch_type in branch_types])
+        elapsed_time = time.time() - start_time
+        for branch_type, (food_expense, power_expense) in zip(branch_types, branches):
+            print(f"Switching to {branch_type}: food expense {int(food_expense)} kr., power expense {int(power_expense)} kr., total {round(food_expense + power_expense, 2)} kr.")
+        print(f"Took {round(elapsed_time, 2)} seconds")
+
+    elif config.get("sweep", {}).get("enabled", False):
+        print(f"Running {config['sweep'].get('method', 'GRID')} sweep of {config['sweep']['thermostat_type']} thermostat parameters...")
+        start_time = time.time()
+        ranking = sweep.run_sweep(config["sweep"], power_prices, cooler_options)
+        elapsed_time = time.time() - start_time
+        for mean_cost, parameters in ranking[:10]:
+            print(f"{mean_cost:.2f} kr. per month: {parameters}")
+        print(f"Took {round(elapsed_time, 2)} seconds")
+
+    elif config["simulate_multiple_months"]:
+        if config["comparison_simulation"] and config.get("paired_comparison", False):
+            start_time = time.time()
+            print(f"Running paired comparison for up to {config['simulation_steps']} steps (months)...")
+            result = comparison.paired_comparison(thermostat, second_thermostat, power_prices, config["simulation_steps"], config["confidence_interval_width"],
+                                                  config.get("confidence_level", 0.95), config.get("minimum_steps", 100), config.get("paired_batch_size", 100),
+                                                  config.get("workers", 1), config.get("seed"), cooler_options, price_scenarios, period_starts)
+            elapsed_time = time.time() - start_time
+            print(f"{config['thermostat_type']} minus {config['second_thermostat_type']}: {result}")
+            if period_starts is not None:
+                print_period_expenses(prices, result_period, period_starts, result.period_differences, "Mean difference, ")
+            if not result.converged:
+                print(f"The confidence interval did not reach a width of {config['confidence_interval_width']} kr. within {config['simulation_steps']} months")
+            print(f"Finished. Took {round(elapsed_time, 2)} seconds")
+
+            renderer.plot("paired_comparison_boxplot", vis.plot_boxplot, result.first_expenses, config["thermostat_type"], result.second_expenses, config["second_thermostat_type"])
+
+        elif config["comparison_simulation"]:
             start_time = time.time()
-            print(f"Running first simulation for {config['simulation_steps']} steps (months)...")
-            food_expenses_per_month, power_expenses_per_month = simulate_multiple_months(cooler, config["simulation_steps"])
-            print(f"Running second simulation for {config['simulation_steps']} steps (months)...")
-            second_food_expenses_per_month, second_power_expenses_per_month = simulate_multiple_months(second_cooler, config["simulation_steps"])
+            print(f"Running both simulations for {config['simulation_steps']} steps (months)...")
+            first_values, second_values = run_multiple_months(config, [cooler, second_cooler], power_prices, cooler_options, cache, price_scenarios, period_starts)
+            if period_starts is not None:
+                print_period_expenses(prices, result_period, period_starts, first_values[0] + first_values[1], f"{config['thermostat_type']}, average ")
+                print_period_expenses(prices, result_period, period_starts, second_values[0] + second_values[1], f"{config['second_thermostat_type']}, average ")
+            food_expenses_per_month, power_expenses_per_month = map(total_per_month, first_values)
+            second_food_expenses_per_month, second_power_expenses_per_month = map(total_per_month, second_values)
             elapsed_time = time.time() - start_time
             print(f"Finished. Took {round(elapsed_time, 2)} seconds")
 
-            vis.plot_boxplot(food_expenses_per_month + power_expenses_per_month, config["thermostat_type"], second_food_expenses_per_month + second_power_expenses_per_month, config["second_thermostat_type"])
+            renderer.plot("comparison_boxplot", vis.plot_boxplot, food_expenses_per_month + power_expenses_per_month, config["thermostat_type"],
+                          second_food_expenses_per_month + second_power_expenses_per_month, config["second_thermostat_type"])
+
+        elif config.get("streaming", False):
+            print(f"Running streaming simulation for {config['simulation_steps']} steps (months)...")
+            start_time = time.time()
+            histogram_config = config.get("streaming_histogram") or {}
+            aggregator = streaming.MonthlyExpenseAggregator(histogram_range=(histogram_config.get("min"), histogram_config.get("max")), histogram_bins=histogram_config.get("bins", 60))
+            streaming.stream_multiple_months(thermostat, power_prices, config["simulation_steps"], aggregator, config.get("batch_size", 1000),
+                                             config.get("workers", 1), config.get("seed"), cooler_options, price_scenarios, period_starts)
+            elapsed_time = time.time() - start_time
+
+            print(aggregator.summary())
+            if histogram_config.get("output") is not None:
+                aggregator.total_histogram.dump(histogram_config["output"])
+            if period_starts is not None:
+                print_period_expenses(prices, result_period, period_starts, aggregator.period_means, "Average ")
+            print(f"Thermostat type: {config['thermostat_type']}")
+            print(f"Took {round(elapsed_time, 2)} seconds")
 
         else:
             print(f"Running simulation for {config['simulation_steps']} steps (months)...")
             start_time = time.time()
-            food_expenses_per_month, power_expenses_per_month = simulate_multiple_months(cooler, config["simulation_steps"])
+            food_expenses_per_month, power_expenses_per_month = run_multiple_months(config, [cooler], power_prices, cooler_options, cache, price_scenarios, period_starts)[0]
             elapsed_time = time.time() - start_time
+            if period_starts is not None:
+                print_period_expenses(prices, result_period, period_starts, food_expenses_per_month + power_expenses_per_month, "Average ")
+                food_expenses_per_month, power_expenses_per_month = total_per_month(food_expenses_per_month), total_per_month(power_expenses_per_month)
 
-            print(f"Average food expense over {config['simulation_steps']} months: {int(np.mean(food_expenses_per_month))} kr.")
-            print(f"Average power expense over {config['simulation_steps']} months: {int(np.mean(power_expenses_per_month))} kr. ")
+            print(f"Average food expense over {config['simulation_steps']} runs of the price horizon: {int(np.mean(food_expenses_per_month))} kr.")
+            print(f"Average power expense over {config['simulation_steps']} runs of the price horizon: {int(np.mean(power_expenses_per_month))} kr. ")
             print(f"Thermostat type: {config['thermostat_type']}")
             print(f"Took {round(elapsed_time, 2)} seconds")
     else:
@@ -106,26 +361,92 @@ def run_simulation():
         start_time = time.time()
         
         if config["comparison_simulation"]:
-            values = cooler.simulate_month(True)
-            second_values = second_cooler.simulate_month(True)
+            values = simulate_month_cached(cooler, trace_cache, trace_seed(config.get("seed"), 0), cooler_options)
+            second_values = simulate_month_cached(second_cooler, trace_cache, trace_seed(config.get("seed"), 1), cooler_options)
             elapsed_time = time.time() - start_time
-            vis.plot_double_type_overlayed(power_prices, config["thermostat_type"], values[2], config["second_thermostat_type"], second_values[2])
-            vis.cumulative_sum_based_on_condition(power_prices, config["thermostat_type"], values[4], config["second_thermostat_type"], second_values[4])
+            renderer.plot("comparison_temperature", vis.plot_double_type_overlayed, power_prices, config["thermostat_type"], values[2], config["second_thermostat_type"], second_values[2])
+            renderer.plot("comparison_cumulative_power", vis.cumulative_sum_based_on_condition, power_prices, config["thermostat_type"], values[4], config["second_thermostat_type"], second_values[4])
             print(f"Thermostat type: {config['thermostat_type']}, expenses: {str(np.sum(values[0]) + np.sum(values[1]))} kr.")
             print(f"Second thermostat type: {config['second_thermostat_type']}, expenses: {str(np.sum(second_values[0]) + np.sum(second_values[1]))} kr.")
+            if period_starts is not None:
+                print_period_expenses(prices, result_period, period_starts, ci.expenses_per_period(values[0] + values[1], period_starts), f"{config['thermostat_type']}, ")
+                print_period_expenses(prices, result_period, period_starts, ci.expenses_per_period(second_values[0] + second_values[1], period_starts), f"{config['second_thermostat_type']}, ")
         else:
-            values = cooler.simulate_month(True)
+            values = simulate_month_cached(cooler, trace_cache, trace_seed(config.get("seed"), 0), cooler_options)
             elapsed_time = time.time() - start_time
 
-            print(f"Food expense for the month: {int(np.sum(values[0]))} kr.")
-            print(f"Power expense for the month: {int(np.sum(values[1]))} kr.")
-            vis.plot_single_type_overlayed(values[3], values[4], power_prices, values[2], config["thermostat_type"]) #[0:8640//2]
+            print(f"Food expense over the price horizon: {int(np.sum(values[0]))} kr.")
+            print(f"Power expense over the price horizon: {int(np.sum(values[1]))} kr.")
+            if period_starts is not None:
+                print_period_expenses(prices, result_period, period_starts, ci.expenses_per_period(values[0] + values[1], period_starts))
+            renderer.plot(f"{config['thermostat_type']}_overlayed", vis.plot_single_type_overlayed, values[3], values[4], power_prices, values[2], config["thermostat_type"]) #[0:8640//2]
             print(f"Thermostat type: {config['thermostat_type']}")
             print(f"Took {round(elapsed_time, 2)} seconds")
 
-if __name__ == "__main__":
-    import doctest
-    doctest.testmod()
-    print("Doctest successful")
+        for optimal_cooler in [cooler, second_cooler] if config["comparison_simulation"] else [cooler]:
+            if isinstance(optimal_cooler.thermostat_instance, therm.OptimalThermostat):
+                print(f"Lowest expected expenses of any policy: {optimal_cooler.thermostat_instance.expected_cost(power_prices):.2f} kr.")
 
-run_simulation()
\ No newline at end of file
+    renderer.close()
+    if profiler is not None:
+        print(profiler.summary())
+        profiler.dump(config.get("instrumentation_output", "instrumentation.json"))
+
+def main(argv: list = None) -> int:
+    """
+    The command line entry point. Without a subcommand, runs what the config describes.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
+    def add_config_arguments(target_parser, default, overrides_dest):
+        target_parser.add_argument("--config", default=default if default is not None else "config.yaml", help="Path of the config")
+        target_parser.add_argument("--set", dest=overrides_dest, action="append", default=default if default is not None else [], metavar="KEY=VALUE",
+                                   help="Overrides a config value, e.g. --set simulation_steps=500 or --set sweep.method=HALVING. Can be repeated")
+
+    parser = argparse.ArgumentParser(description="Simulates a cooler room controlled by a thermostat")
+    add_config_arguments(parser, None, "overrides")
+    config_parser = argparse.ArgumentParser(add_help=False) # The same arguments after the subcommand, only set when given
+    add_config_arguments(config_parser, argparse.SUPPRESS, "command_overrides") # Kept apart, so they add to the overrides before the subcommand
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("run", parents=[config_parser], help="Runs what the config describes (the default)")
+    compare_parser = subparsers.add_parser("compare", parents=[config_parser], help="Compares two thermostats")
+    compare_parser.add_argument("thermostat_types", nargs="*", metavar="THERMOSTAT_TYPE", help="The first and second thermostat type, instead of the ones in the config")
+    subparsers.add_parser("sweep", parents=[config_parser], help="Runs the parameter sweep of the config")
+    subparsers.add_parser("fleet", parents=[config_parser], help="Runs the fleet of rooms of the config")
+    subparsers.add_parser("branch", parents=[config_parser], help="Runs a month that switches thermostat on a given day, see the branching section of the config")
+    subparsers.add_parser("live", parents=[config_parser], help="Runs live controllers for the rooms of the fleet section on a replay of the power prices")
+    subparsers.add_parser("bench", add_help=False, help="Runs the throughput benchmarks, the arguments after it are passed to bench.py, see bench.py --help")
+    subparsers.add_parser("doctest", help="Runs the doctests of this module")
+    args, bench_arguments = parser.parse_known_args(argv)
+
+    if args.command == "bench": # The benchmarks have their own arguments
+        import bench
+        return bench.main(bench_arguments)
+    if bench_arguments:
+        parser.error(f"unrecognized arguments: {' '.join(bench_arguments)}")
+    if args.command == "doctest":
+        import doctest
+        return 1 if doctest.testmod().failed else 0
+
+    print(f"Reading config from {args.config}...")
+    config = apply_overrides(load_config(args.config), args.overrides + getattr(args, "command_overrides", []))
+    if args.command == "compare":
+        if len(args.thermostat_types) > 2:
+            raise ValueError("compare takes at most two thermostat types")
+        for key, thermostat_type in zip(["thermostat_type", "second_thermostat_type"], args.thermostat_types):
+            config[key] = thermostat_type
+        config["comparison_simulation"] = True
+    elif args.command == "sweep":
+        config.setdefault("sweep", {})["enabled"] = True
+    elif args.command == "fleet":
+        config.setdefault("fleet", {})["enabled"] = True
+    elif args.command == "branch":
+        config.setdefault("branching", {})["enabled"] = True
+    elif args.command == "live":
+        config.setdefault("live", {})["enabled"] = True
+    run_simulation(config)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
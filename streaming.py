@@ -0,0 +1,292 @@
+"""
+Online accumulators for simulation results, so very long runs can be summarised in constant memory.
+Results are fed in as months complete, and no per-month or per-tick arrays are kept.
+"""
+import json
+import os
+
+import numpy as np
+
+import parallel
+
+class WelfordAccumulator():
+    """
+    Running count, mean, variance, minimum and maximum, using Welford's method.
+    Values can be added one at a time or as arrays.
+
+    >>> accumulator = WelfordAccumulator()
+    >>> accumulator.add(np.array([1.0, 2.0]))
+    >>> accumulator.add(np.array([3.0, 4.0]))
+    >>> accumulator.count, accumulator.mean, round(accumulator.variance, 4)
+    (4, 2.5, 1.6667)
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.sum_of_squares = 0.0 # Sum of squared differences from the mean
+        self.minimum = float("inf")
+        self.maximum = float("-inf")
+
+    def add(self, values):
+        """
+        Adds a value or an array of values. Arrays are merged in one step with Chan's formula.
+        """
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        if len(values) == 0:
+            return
+        batch_count = len(values)
+        batch_mean = float(np.mean(values))
+        batch_sum_of_squares = float(np.sum((values - batch_mean) ** 2))
+
+        total_count = self.count + batch_count
+        delta = batch_mean - self.mean
+        self.mean += delta * batch_count / total_count
+        self.sum_of_squares += batch_sum_of_squares + delta ** 2 * self.count * batch_count / total_count
+        self.count = total_count
+        self.minimum = min(self.minimum, float(np.min(values)))
+        self.maximum = max(self.maximum, float(np.max(values)))
+
+    @property
+    def variance(self) -> float:
+        """
+        The sample variance
+        """
+        if self.count < 2:
+            return float("nan")
+        return self.sum_of_squares / (self.count - 1)
+
+    @property
+    def standard_deviation(self) -> float:
+        return float(np.sqrt(self.variance))
+
+class P2Quantile():
+    """
+    Estimates a single quantile in constant memory with the P-square algorithm of Jain and Chlamtac.
+    Keeps five markers, whose heights are adjusted as values come in.
+
+    >>> estimator = P2Quantile(0.5)
+    >>> for value in np.random.default_rng(0).random(10000):
+    ...     estimator.add(value)
+    >>> round(estimator.value, 1)
+    0.5
+    """
+    def __init__(self, quantile: float):
+        self.quantile = quantile
+        self.initial_values = [] # The first five values, before the markers exist
+        self.heights = None
+        self.positions = None
+        self.desired_positions = None
+        self.increments = [0.0, quantile / 2, quantile, (1 + quantile) / 2, 1.0]
+
+    def add(self, value: float):
+        """
+        Adds a single value
+        """
+        value = float(value)
+        if self.heights is None:
+            self.initial_values.append(value)
+            if len(self.initial_values) == 5:
+                self.heights = sorted(self.initial_values)
+                self.positions = [1, 2, 3, 4, 5]
+                self.desired_positions = [1, 1 + 2 * self.quantile, 1 + 4 * self.quantile, 3 + 2 * self.quantile, 5]
+            return
+
+        heights = self.heights
+        positions = self.positions
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = max(index for index in range(4) if heights[index] <= value)
+
+        for index in range(cell + 1, 5):
+            positions[index] += 1
+        for index in range(5):
+            self.desired_positions[index] += self.increments[index]
+
+        # Move the middle markers towards their desired positions
+        for index in range(1, 4):
+            offset = self.desired_positions[index] - positions[index]
+            if (offset >= 1 and positions[index + 1] - positions[index] > 1) or (offset <= -1 and positions[index - 1] - positions[index] < -1):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(index, step)
+                if not heights[index - 1] < height < heights[index + 1]:
+                    height = heights[index] + step * (heights[index + step] - heights[index]) / (positions[index + step] - positions[index])
+                heights[index] = height
+                positions[index] += step
+
+    def _parabolic(self, index: int, step: int) -> float:
+        heights = self.heights
+        positions = self.positions
+        return heights[index] + step / (positions[index + 1] - positions[index - 1]) * (
+            (positions[index] - positions[index - 1] + step) * (heights[index + 1] - heights[index]) / (positions[index + 1] - positions[index])
+            + (positions[index + 1] - positions[index] - step) * (heights[index] - heights[index - 1]) / (positions[index] - positions[index - 1]))
+
+    @property
+    def value(self) -> float:
+        """
+        The current estimate of the quantile
+        """
+        if self.heights is None:
+            return float(np.quantile(self.initial_values, self.quantile)) if self.initial_values else float("nan")
+        return self.heights[2]
+
+class QuantileSketch():
+    """
+    Several P-square quantile estimators fed with the same values
+    """
+    def __init__(self, quantiles: tuple = (0.05, 0.5, 0.95)):
+        self.estimators = {quantile: P2Quantile(quantile) for quantile in quantiles}
+
+    def add(self, values):
+        for value in np.atleast_1d(values):
+            for estimator in self.estimators.values():
+                estimator.add(value)
+
+    @property
+    def values(self) -> dict:
+        """
+        The current estimate of every quantile
+        """
+        return {quantile: estimator.value for quantile, estimator in self.estimators.items()}
+
+class ExpenseHistogram():
+    """
+    A histogram with fixed bins, and counters for values below and above the bins.
+    A bound that is None is taken from the first values added, widened by half their spread, so later values mostly fall in the bins.
+
+    >>> histogram = ExpenseHistogram(0, 10, 2)
+    >>> histogram.add(np.array([-1.0, 1.0, 6.0, 7.0, 11.0]))
+    >>> histogram.counts.tolist(), histogram.below, histogram.above
+    ([1, 2], 1, 1)
+    >>> histogram = ExpenseHistogram(bin_count=4)
+    >>> histogram.add(np.array([100.0, 200.0]))
+    >>> histogram.bin_edges.tolist()
+    [50.0, 100.0, 150.0, 200.0, 250.0]
+    """
+    def __init__(self, lowest: float = None, highest: float = None, bin_count: int = 50):
+        self.lowest = lowest
+        self.highest = highest
+        self.bin_count = bin_count
+        self.bin_edges = None if lowest is None or highest is None else np.linspace(lowest, highest, bin_count + 1)
+        self.counts = np.zeros(bin_count, dtype=np.int64)
+        self.below = 0
+        self.above = 0
+
+    def add(self, values):
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        if len(values) == 0:
+            return
+        if self.bin_edges is None:
+            margin = max(float(np.max(values) - np.min(values)), 0.01 * abs(float(np.mean(values))), 1.0) / 2
+            lowest = float(np.min(values)) - margin if self.lowest is None else self.lowest
+            highest = float(np.max(values)) + margin if self.highest is None else self.highest
+            self.bin_edges = np.linspace(lowest, highest, self.bin_count + 1)
+        self.counts += np.histogram(values, self.bin_edges)[0]
+        self.below += int(np.sum(values < self.bin_edges[0]))
+        self.above += int(np.sum(values > self.bin_edges[-1]))
+
+    def summary(self, unit: str = "months") -> str:
+        if self.bin_edges is None:
+            return "no values"
+        fullest = int(np.argmax(self.counts))
+        return (f"{self.bin_count} bins from {self.bin_edges[0]:.2f} to {self.bin_edges[-1]:.2f} kr., {self.below} {unit} below and {self.above} above, "
+                f"the fullest bin is {self.bin_edges[fullest]:.2f} to {self.bin_edges[fullest + 1]:.2f} kr. with {self.counts[fullest]} {unit}")
+
+    def to_dict(self) -> dict:
+        return {
+            "bin_edges": [] if self.bin_edges is None else self.bin_edges.tolist(),
+            "counts": self.counts.tolist(),
+            "below": self.below,
+            "above": self.above,
+        }
+
+    def dump(self, path: str):
+        """
+        Writes the histogram to a json file
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+class MonthlyExpenseAggregator():
+    """
+    Summarises the food loss, power and total expenses of any amount of months in constant memory.
+    histogram_range is the range (kr.) of the histogram of the total expenses, see ExpenseHistogram for bounds that are None.
+    """
+    def __init__(self, quantiles: tuple = (0.05, 0.5, 0.95), histogram_range: tuple = (None, None), histogram_bins: int = 60):
+        self.food = WelfordAccumulator()
+        self.power = WelfordAccumulator()
+        self.total = WelfordAccumulator()
+        self.total_quantiles = QuantileSketch(quantiles)
+        self.total_histogram = ExpenseHistogram(histogram_range[0], histogram_range[1], histogram_bins)
+        self.period_totals = None # Sum of the total expenses of every period over the months, if they are added per period
+
+    def add(self, food_expenses, power_expenses):
+        """
+        Adds the expenses of one or more months, or (months, periods) arrays of their expenses per period
+
+        >>> aggregator = MonthlyExpenseAggregator()
+        >>> aggregator.add(np.array([[1.0, 2.0], [3.0, 4.0]]), np.zeros((2, 2)))
+        >>> aggregator.total.mean, aggregator.period_means.tolist()
+        (5.0, [2.0, 3.0])
+        """
+        total_expenses = np.asarray(food_expenses) + np.asarray(power_expenses)
+        if total_expenses.ndim == 2:
+            self.period_totals = np.sum(total_expenses, axis=0) + (self.period_totals if self.period_totals is not None else 0.0)
+            total_expenses = np.sum(total_expenses, axis=1)
+            food_expenses = np.sum(food_expenses, axis=1)
+            power_expenses = np.sum(power_expenses, axis=1)
+        self.food.add(food_expenses)
+        self.power.add(power_expenses)
+        self.total.add(total_expenses)
+        self.total_quantiles.add(total_expenses)
+        self.total_histogram.add(total_expenses)
+
+    @property
+    def period_means(self) -> np.ndarray:
+        """
+        The mean total expense of every period, or None if the months weren't added per period
+        """
+        return None if self.period_totals is None else self.period_totals / self.total.count
+
+    def summary(self) -> str:
+        lines = [
+            f"Months: {self.total.count}",
+            f"Average food expense: {self.food.mean:.2f} kr. (std {self.food.standard_deviation:.2f})",
+            f"Average power expense: {self.power.mean:.2f} kr. (std {self.power.standard_deviation:.2f})",
+            f"Average total expense: {self.total.mean:.2f} kr. (std {self.total.standard_deviation:.2f}, min {self.total.minimum:.2f}, max {self.total.maximum:.2f})",
+        ]
+        lines += [f"{round(quantile * 100)}th percentile of total expense: {value:.2f} kr." for quantile, value in self.total_quantiles.values.items()]
+        lines.append(f"Histogram of total expense: {self.total_histogram.summary()}")
+        return "\n".join(lines)
+
+def stream_multiple_months(thermostat, power_prices: np.ndarray, simulation_steps: int, aggregator: MonthlyExpenseAggregator = None,
+                           batch_size: int = 1000, workers: int = 1, seed: int = None, cooler_options: dict = None,
+                           price_scenarios=None, period_starts: np.ndarray = None) -> MonthlyExpenseAggregator:
+    """
+    Simulates simulation_steps months and feeds the expenses of every round of blocks into the aggregator.
+    Only one round of months (batch_size per worker) is held in memory at a time.
+    Gives the same months as parallel.simulate_multiple_months_parallel for the same seed and batch_size.
+    """
+    if aggregator is None:
+        aggregator = MonthlyExpenseAggregator()
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    if workers is None:
+        workers = os.cpu_count()
+    round_months = batch_size * max(1, workers)
+    first_block = 0
+    simulated_months = 0
+
+    with parallel.SimulationPool(power_prices, workers) as pool: # Started once, and reused by every round
+        while simulated_months < simulation_steps:
+            month_count = min(round_months, simulation_steps - simulated_months)
+            food_expenses, power_expenses = pool.simulate([thermostat], month_count, seed, batch_size, cooler_options, first_block, price_scenarios, period_starts)[0]
+            aggregator.add(food_expenses, power_expenses)
+            simulated_months += month_count
+            first_block += -(-month_count // batch_size)
+
+    return aggregator
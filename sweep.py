@@ -0,0 +1,182 @@
+"""
+Tunes thermostat parameters by simulating many months for every combination of parameter values,
+and ranking them by expected monthly cost.
+
+Every point is evaluated with the same seed, so all points see the same door events.
+Results are memoized per (thermostat, parameters, seed, months, price series, cooler options), optionally in a json file.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import json
+import math
+import os
+
+import numpy as np
+
+import door_events
+import parallel
+import price_features
+import thermostat as therm
+
+def parameter_values(value_config) -> list:
+    """
+    Turns the config of a single parameter into a list of values.
+    Either a list of values, or a range with min, max, num and optionally integer.
+
+    >>> parameter_values([1, 2])
+    [1, 2]
+    >>> parameter_values({"min": 10, "max": 20, "num": 3, "integer": True})
+    [10, 15, 20]
+    """
+    if isinstance(value_config, dict):
+        values = np.linspace(value_config["min"], value_config["max"], value_config["num"])
+        if value_config.get("integer", False):
+            return sorted({int(round(value)) for value in values})
+        return [float(value) for value in values]
+    if isinstance(value_config, list):
+        return value_config
+    return [value_config]
+
+def parameter_grid(parameters_config: dict) -> list:
+    """
+    All combinations of the parameter values, as a list of dicts
+
+    >>> parameter_grid({"a": [1, 2], "b": [3]})
+    [{'a': 1, 'b': 3}, {'a': 2, 'b': 3}]
+    """
+    names = list(parameters_config)
+    value_lists = [parameter_values(parameters_config[name]) for name in names]
+    return [dict(zip(names, values)) for values in itertools.product(*value_lists)]
+
+class SweepCache():
+    """
+    Memoizes the mean monthly cost of evaluated points. Saved as json if a path is given.
+    """
+    def __init__(self, path: str = None):
+        self.path = path
+        self.results = {}
+        if path is not None and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                self.results = json.load(file)
+
+    @staticmethod
+    def key(thermostat_type: str, parameters: dict, seed: int, months: int, power_prices: np.ndarray, cooler_options: dict = None) -> str:
+        """
+        A string key for a point, independent of the order of the parameters
+        """
+        options_description = [(name, describe_option(value)) for name, value in sorted((cooler_options or {}).items())]
+        return json.dumps([thermostat_type, sorted(parameters.items()), seed, months, price_features.price_key(power_prices)[1], options_description])
+
+    def get(self, key: str):
+        """
+        The memoized mean monthly cost, or None
+        """
+        return self.results.get(key)
+
+    def put(self, key: str, mean_cost: float):
+        """
+        Memoizes a mean monthly cost
+        """
+        self.results[key] = mean_cost
+
+    def save(self):
+        """
+        Writes the cache to its json file, if it has one
+        """
+        if self.path is None:
+            return
+        with open(self.path, "w", encoding="utf-8") as file:
+            json.dump(self.results, file)
+
+def describe_option(value) -> str:
+    """
+    A description of a cooler option for the cache key. Objects like door models are described by their attributes.
+
+    >>> describe_option(door_events.BernoulliDoorModel(0.2))
+    "BernoulliDoorModel[('open_probability', 0.2)]"
+    """
+    if hasattr(value, "__dict__"):
+        return type(value).__name__ + repr(sorted(vars(value).items()))
+    return repr(value)
+
+def evaluate_point(thermostat_type: str, parameters: dict, power_prices: np.ndarray, months: int, seed: int, batch_size: int, cooler_options: dict = None) -> float:
+    """
+    The mean monthly cost (food loss and power) of a thermostat with the given parameters
+    """
+    thermostat = therm.ThermostatType[thermostat_type].value()
+    thermostat.set_parameters(**parameters)
+    food_expenses, power_expenses = parallel.simulate_multiple_months_parallel([thermostat], power_prices, months, 1, seed, batch_size, cooler_options)[0]
+    return float(np.mean(food_expenses + power_expenses))
+
+def _evaluate_shared_point(thermostat_type, parameters, months, seed, batch_size, cooler_options) -> float:
+    return evaluate_point(thermostat_type, parameters, parallel.worker_power_prices(), months, seed, batch_size, cooler_options)
+
+def evaluate_points(thermostat_type: str, points: list, power_prices: np.ndarray, months: int, seed: int, cache: SweepCache,
+                    workers: int = 1, batch_size: int = 1000, cooler_options: dict = None) -> list:
+    """
+    The mean monthly cost of every point. Points missing from the cache are spread over the workers.
+    """
+    keys = [SweepCache.key(thermostat_type, point, seed, months, power_prices, cooler_options) for point in points]
+    missing = [index for index, key in enumerate(keys) if cache.get(key) is None]
+
+    if workers is None:
+        workers = os.cpu_count()
+    if workers <= 1 or len(missing) <= 1:
+        for index in missing:
+            cache.put(keys[index], evaluate_point(thermostat_type, points[index], power_prices, months, seed, batch_size, cooler_options))
+    else:
+        with parallel.shared_power_prices(power_prices) as initargs:
+            with ProcessPoolExecutor(max_workers=workers, initializer=parallel.attach_power_prices, initargs=initargs) as executor:
+                futures = {index: executor.submit(_evaluate_shared_point, thermostat_type, points[index], months, seed, batch_size, cooler_options) for index in missing}
+                for index, future in futures.items():
+                    cache.put(keys[index], future.result())
+
+    cache.save()
+    return [cache.get(key) for key in keys]
+
+def grid_search(thermostat_type: str, points: list, power_prices: np.ndarray, months: int, seed: int, cache: SweepCache, **kwargs) -> list:
+    """
+    Evaluates every point for the full amount of months. Returns (mean cost, parameters) pairs, cheapest first.
+    """
+    costs = evaluate_points(thermostat_type, points, power_prices, months, seed, cache, **kwargs)
+    return sorted(zip(costs, points), key=lambda pair: pair[0])
+
+def successive_halving(thermostat_type: str, points: list, power_prices: np.ndarray, months: int, seed: int, cache: SweepCache,
+                       min_months: int = 10, reduction_factor: int = 3, **kwargs) -> list:
+    """
+    Evaluates every point for min_months months, keeps the cheapest 1/reduction_factor of them,
+    and repeats with reduction_factor times as many months, until months is reached.
+    Returns (mean cost, parameters) pairs of the last round, cheapest first.
+    """
+    candidates = list(points)
+    round_months = min(min_months, months)
+    while True:
+        ranking = grid_search(thermostat_type, candidates, power_prices, round_months, seed, cache, **kwargs)
+        print(f"Evaluated {len(candidates)} candidates for {round_months} months, best: {ranking[0][0]:.2f} kr. {ranking[0][1]}")
+        if round_months >= months:
+            return ranking
+        candidates = [point for _, point in ranking[:math.ceil(len(candidates) / reduction_factor)]]
+        round_months = min(round_months * reduction_factor, months)
+
+def run_sweep(sweep_config: dict, power_prices: np.ndarray, cooler_options: dict = None) -> list:
+    """
+    Runs the sweep described by the sweep section of the config. Returns (mean cost, parameters) pairs, cheapest first.
+    """
+    thermostat_type = sweep_config["thermostat_type"]
+    points = parameter_grid(sweep_config["parameters"])
+    cache = SweepCache(sweep_config.get("cache_path"))
+    kwargs = {
+        "workers": sweep_config.get("workers", 1),
+        "batch_size": sweep_config.get("batch_size", 1000),
+        "cooler_options": cooler_options,
+    }
+    seed = sweep_config.get("seed", 0)
+    months = sweep_config.get("months", 100)
+
+    method = sweep_config.get("method", "GRID")
+    if method == "GRID":
+        return grid_search(thermostat_type, points, power_prices, months, seed, cache, **kwargs)
+    if method == "HALVING":
+        return successive_halving(thermostat_type, points, power_prices, months, seed, cache,
+                                  sweep_config.get("min_months", 10), sweep_config.get("reduction_factor", 3), **kwargs)
+    raise ValueError(f"Invalid sweep method: {method}")
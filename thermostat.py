@@ -7,8 +7,17 @@ from abc import ABC, abstractmethod
 import numpy as np
 
 import cooler_instance
+import optimal
+import price_features
 
+def at_least(temperature):
+    """
+    Turns "on when the temperature is at least x" into a cutoff for "on when the temperature is above the cutoff"
 
+    >>> bool(5.0 > at_least(5.0))
+    True
+    """
+    return np.nextafter(temperature, -np.inf)
 
 class Thermostat(ABC):
     """
@@ -17,11 +26,55 @@ class Thermostat(ABC):
     def __init__(self):
         pass
 
+    def __getstate__(self):
+        """
+        Leaves out cached price features (attributes starting with an underscore) when pickling,
+        e.g. when a thermostat is sent to a worker process. They are recomputed when needed.
+        """
+        return {key: value for key, value in vars(self).items() if not key.startswith("_")}
+
+    def get_parameters(self) -> dict:
+        """
+        Returns the tunable parameters of the thermostat, by name
+        """
+        return self.__getstate__()
+
+    def set_parameters(self, **parameters):
+        """
+        Changes tunable parameters of the thermostat, e.g. set_parameters(price_threshold=1.5)
+        """
+        for name, value in parameters.items():
+            if name not in self.get_parameters():
+                raise ValueError(f"{type(self).__name__} has no parameter {name}")
+            setattr(self, name, value)
+
     @abstractmethod
     def evaluate_cooler_state(self, room: "cooler_instance.CoolerInstance") -> bool:
         """
         Returns whether the thermostat should be on or off
         """
+
+    def evaluate_cooler_state_batch(self, room: "cooler_instance.BatchCoolerInstance") -> np.ndarray:
+        """
+        Returns whether the thermostat should be on or off, for every room in a batch.
+        Falls back to calling evaluate_cooler_state once per room, subclasses override it with array logic.
+        """
+        return np.fromiter((self.evaluate_cooler_state(room.room_view(i)) for i in range(room.room_count)), dtype=bool, count=room.room_count)
+
+    def compile_thresholds(self, power_prices: np.ndarray) -> np.ndarray:
+        """
+        Returns an array with a temperature cutoff per tick, so that the thermostat is on
+        exactly when the room temperature is above the cutoff of the current tick.
+        Returns None if the thermostat can't be described this way, then evaluate_cooler_state is used instead.
+        """
+        return None
+
+    def attach_room(self, room):
+        """
+        Called when a cooler is built with this thermostat. Thermostats that plan ahead
+        can read the door model, tick length and physical constants of the room here.
+        """
+
 class SimpleThermostat(Thermostat):
     """
     Control mode: if the room temperature is above 5 degrees, turn on the compressor
@@ -29,6 +82,12 @@ class SimpleThermostat(Thermostat):
     def evaluate_cooler_state(self, room: "cooler_instance.CoolerInstance") -> bool:
         return room.current_temperature > 5
 
+    def evaluate_cooler_state_batch(self, room: "cooler_instance.BatchCoolerInstance") -> np.ndarray:
+        return room.current_temperature > 5
+
+    def compile_thresholds(self, power_prices: np.ndarray) -> np.ndarray:
+        return np.full(np.shape(power_prices), 5.0)
+
 class OpportunistThermostat(Thermostat):
     """
     More likely to keep cooling when the price is low. Doesn't cool below 3.5 degrees.
@@ -50,6 +109,13 @@ class OpportunistThermostat(Thermostat):
         else:
             return False
 
+    def evaluate_cooler_state_batch(self, room: "cooler_instance.BatchCoolerInstance") -> np.ndarray:
+        temperature = room.current_temperature
+        return (temperature > 6.3) | ((temperature >= 3.5) & (room.current_prices < self.price_threshold))
+
+    def compile_thresholds(self, power_prices: np.ndarray) -> np.ndarray:
+        return np.where(power_prices < self.price_threshold, at_least(3.5), 6.3)
+
 
 class DesperationThermostat(Thermostat):
     """
@@ -66,6 +132,15 @@ class DesperationThermostat(Thermostat):
         price_point = (room.current_temperature - self.lowest_temperature) / (self.highest_temperature - self.lowest_temperature) * (self.highest_price - self.lowest_price) + self.lowest_price
         return room.power_prices[room.tick_counter] <= price_point
 
+    def evaluate_cooler_state_batch(self, room: "cooler_instance.BatchCoolerInstance") -> np.ndarray:
+        price_point = (room.current_temperature - self.lowest_temperature) / (self.highest_temperature - self.lowest_temperature) * (self.highest_price - self.lowest_price) + self.lowest_price
+        return room.current_prices <= price_point
+
+    def compile_thresholds(self, power_prices: np.ndarray) -> np.ndarray:
+        # price <= price_point, solved for the temperature
+        temperature_point = (power_prices - self.lowest_price) / (self.highest_price - self.lowest_price) * (self.highest_temperature - self.lowest_temperature) + self.lowest_temperature
+        return at_least(temperature_point)
+
 class DesperationOpportunistThermostat(Thermostat):
     """
     This thermostat mixes the DESPERATION thermostat and the OPPORTUNIST thermostat.
@@ -90,64 +165,161 @@ class DesperationOpportunistThermostat(Thermostat):
         else:
             return room.power_prices[room.tick_counter] < price_point
 
+    def evaluate_cooler_state_batch(self, room: "cooler_instance.BatchCoolerInstance") -> np.ndarray:
+        temperature = room.current_temperature
+        price_point = (temperature - self.lowest_temperature) / (self.highest_temperature - self.lowest_temperature) * (self.highest_price - self.lowest_price) + self.lowest_price
+        current_prices = room.current_prices
+        return (temperature > 6.375) | ((temperature >= 3.5) & ((current_prices < 0.5) | (current_prices < price_point)))
+
+    def compile_thresholds(self, power_prices: np.ndarray) -> np.ndarray:
+        # price < price_point, solved for the temperature
+        temperature_point = (power_prices - self.lowest_price) / (self.highest_price - self.lowest_price) * (self.highest_temperature - self.lowest_temperature) + self.lowest_temperature
+        thresholds = np.minimum(6.375, np.maximum(temperature_point, at_least(3.5)))
+        return np.where(power_prices < 0.5, at_least(3.5), thresholds)
+
 class PeerReviewThermostat(Thermostat):
     """
     This thermostat that buys if it is the lowest in the group of prices around it
     """
+    _feature_prices = None # The price series the cached window means belong to
+    _feature_key = None
+    _average_peer_prices = None
+    _tick_seconds = 300 # Set by attach_room
+
     def __init__(self):
         self.look_around = 245
 
+    def attach_room(self, room):
+        self._tick_seconds = room.tick_seconds
+
+    @property
+    def look_around_ticks(self) -> int:
+        """
+        The amount of ticks looked at on either side of a tick. look_around counts 5 minute periods, like PartitionThermostat.purchase_per_partition.
+
+        >>> thermostat = PeerReviewThermostat()
+        >>> thermostat.attach_room(cooler_instance.CoolerInstance(SimpleThermostat(), np.ones(720), tick_seconds=3600))
+        >>> thermostat.look_around_ticks
+        20
+        """
+        return max(1, round(self.look_around * 300 / self._tick_seconds))
+
+    def average_peer_prices(self, power_prices: np.ndarray) -> np.ndarray:
+        """
+        The mean price around every tick. Looked up in the price feature cache, and kept
+        on the thermostat as long as the price series and parameters don't change.
+        """
+        if power_prices is not self._feature_prices or self._feature_key != self.look_around_ticks:
+            self._average_peer_prices = price_features.get_window_means(power_prices, self.look_around_ticks)
+            self._feature_prices = power_prices
+            self._feature_key = self.look_around_ticks
+        return self._average_peer_prices
+
     def evaluate_cooler_state(self, room: "cooler_instance.CoolerInstance") -> bool:
         if room.current_temperature > 6.34:
             return True
         elif room.current_temperature < 3.5:
             return False
-        low_check = max(0, room.tick_counter - self.look_around)
-        hich_check = min(8640, room.tick_counter + self.look_around)
-        average_peer_prices = np.mean(room.power_prices[low_check:hich_check])
+        average_peer_prices = self.average_peer_prices(room.power_prices)[room.tick_counter]
         current_price = room.power_prices[room.tick_counter]        
         if current_price < average_peer_prices:
             return True
         return False
 
+    def evaluate_cooler_state_batch(self, room: "cooler_instance.BatchCoolerInstance") -> np.ndarray:
+        temperature = room.current_temperature
+        average_peer_prices = self.average_peer_prices(room.power_prices)[..., room.tick_counter]
+        return (temperature > 6.34) | ((temperature >= 3.5) & (room.current_prices < average_peer_prices))
+
+    def compile_thresholds(self, power_prices: np.ndarray) -> np.ndarray:
+        return self.thresholds_from_peer_prices(power_prices, self.average_peer_prices(power_prices))
+
+    def thresholds_from_peer_prices(self, power_prices, average_peer_prices):
+        """
+        The temperature cutoffs for the prices, given the mean price around them
+        """
+        return np.where(power_prices < average_peer_prices, at_least(3.5), 6.34)
+
 class PartitionThermostat(Thermostat):
     """
     Buys all the cheapest power, within the partition. If partitio_count = 10, it will buy the cheapest x amount of power
     """
+    _feature_prices = None # The price series the cached partition cutoffs belong to
+    _feature_key = None
+    _price_cutoffs = None
+    _tick_seconds = 300 # Set by attach_room
+
     def __init__(self):
         self.partition_count = 50
-        self.partition_size = 8640 / self.partition_count
-
         self.purchase_per_partition =60
 
+    def attach_room(self, room):
+        self._tick_seconds = room.tick_seconds
+
+    @property
+    def ticks_per_month(self) -> int:
+        """
+        The amount of ticks in 30 days. There are partition_count partitions per month, they keep repeating on longer horizons.
+        """
+        return 30 * 86400 // self._tick_seconds
+
+    @property
+    def partition_size(self) -> float:
+        """
+        The amount of ticks in a partition
+
+        >>> thermostat = PartitionThermostat()
+        >>> thermostat.partition_size
+        172.8
+        >>> thermostat.attach_room(cooler_instance.CoolerInstance(SimpleThermostat(), np.ones(720), tick_seconds=3600))
+        >>> thermostat.partition_size, thermostat.purchase_ticks
+        (14.4, 5)
+        """
+        return self.ticks_per_month / self.partition_count
+
+    @property
+    def purchase_ticks(self) -> int:
+        """
+        The amount of ticks bought per partition. purchase_per_partition counts 5 minute periods, like the expenses.
+        """
+        return max(1, round(self.purchase_per_partition * 300 / self._tick_seconds))
+
+    def price_cutoffs(self, power_prices: np.ndarray) -> np.ndarray:
+        """
+        The highest price that counts as a bargain for every tick, which is the
+        purchase_ticks'th cheapest price in its partition. Looked up in the
+        price feature cache, and kept on the thermostat as long as nothing changes.
+        """
+        feature_key = (self.partition_size, self.purchase_ticks)
+        if power_prices is not self._feature_prices or self._feature_key != feature_key:
+            self._price_cutoffs = price_features.get_partition_cutoffs(power_prices, self.partition_size, self.purchase_ticks)
+            self._feature_prices = power_prices
+            self._feature_key = feature_key
+        return self._price_cutoffs
+
     def evaluate_cooler_state(self, room: "cooler_instance.CoolerInstance") -> bool:
         if room.current_temperature > 6.2:
             return True
         elif room.current_temperature < 3.6:
             return False
-        #Calculate partition start and end as integers
-        partition_start = int((room.tick_counter // self.partition_size) * self.partition_size)
-        partition_end = int(partition_start + self.partition_size)
 
-        # Safeguard: Adjust the slice range to avoid out-of-bounds
-        partition_end = min(partition_end, len(room.power_prices))
-
-        # Extract the sliced array for the current partition
-        partition_sliced_array = room.power_prices[partition_start:partition_end]
-
-        # Handle case where the partition is smaller than expected
-        if len(partition_sliced_array) < self.purchase_per_partition:
-            return False  # Not enough data to evaluate
-
-        # Find the lowest purchase_per_partition prices in the current partition
-        lowest_prices = np.partition(partition_sliced_array, self.purchase_per_partition)[:self.purchase_per_partition]
+        # Partitions with too few prices have a cutoff of -inf, so nothing is bought there
         current_price = room.power_prices[room.tick_counter]
+        return bool(current_price <= self.price_cutoffs(room.power_prices)[room.tick_counter])
 
-        # Compare the current price to the threshold
-        if current_price <= lowest_prices[self.purchase_per_partition - 1]:
-            return True
+    def evaluate_cooler_state_batch(self, room: "cooler_instance.BatchCoolerInstance") -> np.ndarray:
+        temperature = room.current_temperature
+        bargain = room.current_prices <= self.price_cutoffs(room.power_prices)[..., room.tick_counter]
+        return (temperature > 6.2) | ((temperature >= 3.6) & bargain)
 
-        return False
+    def compile_thresholds(self, power_prices: np.ndarray) -> np.ndarray:
+        return self.thresholds_from_price_cutoffs(power_prices, self.price_cutoffs(power_prices))
+
+    def thresholds_from_price_cutoffs(self, power_prices, price_cutoffs):
+        """
+        The temperature cutoffs for the prices, given the highest price that counts as a bargain
+        """
+        return np.where(power_prices <= price_cutoffs, at_least(3.6), 6.2)
 
 class DesperationExponentialThermostat(Thermostat):
     """
@@ -176,6 +348,80 @@ class DesperationExponentialThermostat(Thermostat):
 
         return current_price <= price_point
 
+    def evaluate_cooler_state_batch(self, room: "cooler_instance.BatchCoolerInstance") -> np.ndarray:
+        temperature = room.current_temperature
+        desperation_value = (temperature - self.lowest_temperature) / (self.highest_temperature - self.lowest_temperature)
+        price_point = self.lowest_price * np.exp(self.b * self.steepness * desperation_value)
+        within_bounds = (temperature >= self.lowest_temperature) & (room.current_prices <= price_point)
+        return (temperature > self.highest_temperature) | within_bounds
+
+    def compile_thresholds(self, power_prices: np.ndarray) -> np.ndarray:
+        # price <= price_point, solved for the temperature. Non-positive prices are always cheap enough
+        with np.errstate(divide="ignore", invalid="ignore"):
+            desperation_value = np.log(power_prices / self.lowest_price) / (self.b * self.steepness)
+        temperature_point = np.where(power_prices > 0, self.lowest_temperature + desperation_value * (self.highest_temperature - self.lowest_temperature), -np.inf)
+        thresholds = np.maximum(at_least(temperature_point), at_least(self.lowest_temperature))
+        return np.minimum(self.highest_temperature, thresholds)
+
+
+class OptimalThermostat(Thermostat):
+    """
+    Runs the compressor by the optimal policy for the power prices, found with dynamic programming (see optimal.py).
+    It knows the whole price series in advance, so it is a lower bound for the other thermostats rather than a real option.
+    The policy is solved the first time the thermostat sees a price series, with the door model and physics of its room.
+    """
+    _door_model = None # Set by attach_room
+    _physical_constants = None
+    _tick_seconds = 300
+    _policy_prices = None # The price series the cached policies belong to
+    _policy_key = None
+    _policies = None
+
+    def __init__(self):
+        self.grid_min = -2.0
+        self.grid_max = 14.0
+        self.grid_step = 0.01
+
+    def attach_room(self, room):
+        self._door_model = room.door_model
+        self._physical_constants = room.physical_constants
+        self._tick_seconds = room.tick_seconds
+
+    def policies(self, power_prices: np.ndarray) -> list:
+        """
+        The optimal policy of every price series (one, or a row each for 2D prices), kept as long as nothing changes
+        """
+        policy_key = (self.grid_min, self.grid_max, self.grid_step, self._tick_seconds,
+                      repr(vars(self._door_model)) if self._door_model is not None else None,
+                      repr(vars(self._physical_constants)) if self._physical_constants is not None else None)
+        if power_prices is not self._policy_prices or self._policy_key != policy_key:
+            self._policies = [optimal.solve_for_room(prices, self._door_model, self._physical_constants, self._tick_seconds,
+                                                     grid_min=self.grid_min, grid_max=self.grid_max, grid_step=self.grid_step)
+                              for prices in np.atleast_2d(power_prices)]
+            self._policy_prices = power_prices
+            self._policy_key = policy_key
+        return self._policies
+
+    def expected_cost(self, power_prices: np.ndarray, temperature: float = 5.0) -> float:
+        """
+        The minimum expected expense of the horizon, for a room starting at the temperature
+        """
+        return self.policies(power_prices)[0].expected_cost(temperature)
+
+    def evaluate_cooler_state(self, room: "cooler_instance.CoolerInstance") -> bool:
+        return bool(self.policies(room.power_prices)[0].decide(room.tick_counter, room.current_temperature))
+
+    def evaluate_cooler_state_batch(self, room: "cooler_instance.BatchCoolerInstance") -> np.ndarray:
+        policies = self.policies(room.power_prices)
+        if room.power_prices.ndim == 1:
+            return policies[0].decide(room.tick_counter, room.current_temperature)
+        return np.array([policy.decide(room.tick_counter, temperature) for policy, temperature in zip(policies, room.current_temperature)])
+
+    def compile_thresholds(self, power_prices: np.ndarray) -> np.ndarray:
+        thresholds = [policy.thresholds() for policy in self.policies(power_prices)]
+        if any(row is None for row in thresholds):
+            return None
+        return thresholds[0] if np.ndim(power_prices) == 1 else np.stack(thresholds)
 
 class ThermostatType(Enum):
     """
@@ -188,4 +434,5 @@ class ThermostatType(Enum):
     PEERREVIEW = PeerReviewThermostat
     PARTITION = PartitionThermostat
     DESPERATION_EXPONENTIAL = DesperationExponentialThermostat
+    OPTIMAL = OptimalThermostat
 
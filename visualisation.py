@@ -1,25 +1,48 @@
 """
 A collection of functions to create plots specifically for the cooler room project
+
+Every plot is shown, or saved to output_path if one is given. Series longer than max_points are
+downsampled before plotting. FigureRenderer saves the figures from a background process.
+matplotlib is only imported when a figure is made, so importing this module is cheap.
 """
+from concurrent.futures import ProcessPoolExecutor
+import os
 
-import matplotlib.pyplot as plt
 import numpy as np
-import seaborn as sns
 
-def plot_single_type_overlayed(door_open, compressor_on, price_history, room_temperature, thermostat_type):
+import downsampling
+
+def finish_figure(fig, output_path: str = None):
+    """
+    Shows the figure, or saves it to output_path and closes it
+    """
+    import matplotlib.pyplot as plt
+    if output_path is None:
+        plt.show()
+    else:
+        fig.savefig(output_path)
+        plt.close(fig)
+
+def plot_single_type_overlayed(door_open, compressor_on, price_history, room_temperature, thermostat_type,
+                               max_points: int = None, method: str = "LTTB", output_path: str = None):
     """
     A visualisation of all the variables for a single thermostat type.
     """
+    import matplotlib.pyplot as plt
     # Time axis (assuming all arrays are of equal length)
     time = np.arange(len(price_history))
 
     # Create the figure and primary axis
     fig, ax1 = plt.subplots(figsize=(10, 6))
 
-    # Plot binary state heatmap (Door Open and Compressor On)
-    binary_data = np.vstack([door_open, compressor_on])
-    sns.heatmap(binary_data, ax=ax1, cbar=False, cmap="RdBu", xticklabels=False, yticklabels=['Door Open', 'Compressor On'],
-                alpha=0.3, linewidth=0)  # Light transparency for better overlay
+    # Plot binary state heatmap (Door Open and Compressor On), as the fraction of ticks per bin when downsampled
+    door_fraction, bin_edges = downsampling.bin_means(door_open, max_points)
+    compressor_fraction, _ = downsampling.bin_means(compressor_on, max_points)
+    binary_data = np.vstack([door_fraction, compressor_fraction])
+    ax1.pcolormesh(bin_edges, [0, 1, 2], binary_data, cmap="RdBu", alpha=0.3, vmin=0, vmax=1)  # Light transparency for better overlay
+    ax1.set_yticks([0.5, 1.5])
+    ax1.set_yticklabels(['Door Open', 'Compressor On'])
+    ax1.invert_yaxis()
 
     ax1.set_xlabel("Time Ticks")
     ax1.set_ylabel("Binary States")
@@ -29,19 +52,21 @@ def plot_single_type_overlayed(door_open, compressor_on, price_history, room_tem
     ax2 = ax1.twinx()
 
     # Plot price history and temperature history on the secondary axis
-    ax2.plot(time, price_history, label="Price History", color="green", alpha=0.7, linewidth=2)
-    ax2.plot(time, room_temperature, label="Room Temperature", color="blue", alpha=0.7, linewidth=2)
+    ax2.plot(*downsampling.downsample(time, price_history, max_points, method), label="Price History", color="green", alpha=0.7, linewidth=2)
+    ax2.plot(*downsampling.downsample(time, room_temperature, max_points, method), label="Room Temperature", color="blue", alpha=0.7, linewidth=2)
 
     ax2.set_ylabel("Price / Room Temperature")
     ax2.legend(loc="upper right")
 
     # Display the plot
-    plt.show()
+    finish_figure(fig, output_path)
 
-def plot_double_type_overlayed(price_history, thermostat_type, room_temperature, second_thermostat_type, second_room_temperature):
+def plot_double_type_overlayed(price_history, thermostat_type, room_temperature, second_thermostat_type, second_room_temperature,
+                               max_points: int = None, method: str = "LTTB", output_path: str = None):
     """
     A visualisation of a comparison of room temperature in two models, in the same span as the price history.
     """
+    import matplotlib.pyplot as plt
     # Time axis (assuming all arrays are of equal length)
     time = np.arange(len(price_history))
 
@@ -50,21 +75,23 @@ def plot_double_type_overlayed(price_history, thermostat_type, room_temperature,
 
 
     # Plot price history and temperature history on the secondary axis
-    ax1.plot(time, price_history, label="Price History", color="green", alpha=0.7, linewidth=2)
+    ax1.plot(*downsampling.downsample(time, price_history, max_points, method), label="Price History", color="green", alpha=0.7, linewidth=2)
 
-    ax1.plot(time, room_temperature, label=f"{thermostat_type} room Temperature", color="blue", alpha=0.7, linewidth=2)
-    ax1.plot(time, second_room_temperature, label=f"{second_thermostat_type} room Temperature", color="red", alpha=0.7, linewidth=2)
+    ax1.plot(*downsampling.downsample(time, room_temperature, max_points, method), label=f"{thermostat_type} room Temperature", color="blue", alpha=0.7, linewidth=2)
+    ax1.plot(*downsampling.downsample(time, second_room_temperature, max_points, method), label=f"{second_thermostat_type} room Temperature", color="red", alpha=0.7, linewidth=2)
 
     ax1.set_ylabel("Price / Room Temperature")
     ax1.legend(loc="upper right")
 
     # Display the plot
-    plt.show()
+    finish_figure(fig, output_path)
 
-def plot_boxplot(data, thermostat_type, second_data, second_thermostat_type):
+def plot_boxplot(data, thermostat_type, second_data, second_thermostat_type, max_points: int = None, method: str = "LTTB", output_path: str = None):
     """
     A visualisation of the distribution of data in two thermostat types.
+    max_points and method are unused, a boxplot has no series to downsample.
     """
+    import matplotlib.pyplot as plt
     fig, ax = plt.subplots(figsize=(10, 4))
     ax.set_title(f"{thermostat_type} thermostat variance in expenses")
     ax.boxplot(data, vert=False, positions=[1])
@@ -73,27 +100,26 @@ def plot_boxplot(data, thermostat_type, second_data, second_thermostat_type):
     ax.set_yticks([1, 2])
     ax.set_yticklabels([thermostat_type, second_thermostat_type])
     ax.grid(True)
-    plt.show()
+    finish_figure(fig, output_path)
 
-def cumulative_sum_based_on_condition(price_history, thermostat_type, compressor_on, second_thermostat_type, second_compressor_on):
+def cumulative_sum_based_on_condition(price_history, thermostat_type, compressor_on, second_thermostat_type, second_compressor_on,
+                                      max_points: int = None, method: str = "LTTB", output_path: str = None):
     """
     Calculate the cumulative sum of power expenses in two models.
     """
+    import matplotlib.pyplot as plt
     # Ensure the arrays are the same length
     assert len(compressor_on) == len(price_history), "Arrays must be of the same length"
     assert len(second_compressor_on) == len(price_history), "Arrays must be of the same length"
-    
-    # Filter the prices array based on the boolean array
-    #filtered_prices = price_history * compressor_on
-    second_filtered_prices = price_history * compressor_on
 
+    # Filter the prices array based on the boolean array
     filtered_prices = np.where(compressor_on, price_history, 0)
     second_filtered_prices = np.where(second_compressor_on, price_history, 0)
-    
+
     # Calculate the cumulative sum
     cumulative_sum = np.cumsum(filtered_prices)
     second_cumulative_sum = np.cumsum(second_filtered_prices)
-    
+
     # Time axis (assuming all arrays are of equal length)
     time = np.arange(len(price_history))
 
@@ -101,16 +127,105 @@ def cumulative_sum_based_on_condition(price_history, thermostat_type, compressor
     fig, ax = plt.subplots(figsize=(10, 6))
 
     # Plot price history and temperature history on the secondary axis
-    ax.plot(time, cumulative_sum, label=f"{thermostat_type} room Temperature", color="blue", alpha=0.7, linewidth=2)
-    ax.plot(time, second_cumulative_sum, label=f"{second_thermostat_type} room Temperature", color="red", alpha=0.7, linewidth=2)
+    ax.plot(*downsampling.downsample(time, cumulative_sum, max_points, method), label=f"{thermostat_type} room Temperature", color="blue", alpha=0.7, linewidth=2)
+    ax.plot(*downsampling.downsample(time, second_cumulative_sum, max_points, method), label=f"{second_thermostat_type} room Temperature", color="red", alpha=0.7, linewidth=2)
 
     ax.set_ylabel("Cumulative Price")
     ax.legend(loc="upper right")
 
     ax2 = ax.twinx()
-    ax2.plot(time, price_history, label="Price History", color="green", alpha=0.2, linewidth=2)
+    ax2.plot(*downsampling.downsample(time, price_history, max_points, method), label="Price History", color="green", alpha=0.2, linewidth=2)
     ax2.set_ylabel("Price")
 
 
     # Display the plot
-    plt.show()
\ No newline at end of file
+    finish_figure(fig, output_path)
+
+def plot_fleet_curves(compressor_load, power_expenses, price_history, max_points: int = None, method: str = "LTTB", output_path: str = None):
+    """
+    The amount of running compressors and the power expenses of a fleet of rooms, per tick.
+    """
+    import matplotlib.pyplot as plt
+    time = np.arange(len(price_history))
+
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8), sharex=True)
+
+    ax1.plot(*downsampling.downsample(time, compressor_load, max_points, method), label="Compressors Running", color="blue", alpha=0.7, linewidth=1)
+    ax1.set_ylabel("Compressors Running")
+    ax1.set_title("Fleet load and power expenses")
+
+    ax2.plot(*downsampling.downsample(time, power_expenses, max_points, method), label="Power Expenses", color="red", alpha=0.7, linewidth=1)
+    ax2.set_ylabel("Power Expenses per Tick")
+    ax2.set_xlabel("Time Ticks")
+
+    ax3 = ax2.twinx()
+    ax3.plot(*downsampling.downsample(time, price_history, max_points, method), label="Price History", color="green", alpha=0.3, linewidth=1)
+    ax3.set_ylabel("Price")
+
+    finish_figure(fig, output_path)
+
+def use_headless_backend():
+    """
+    Switches matplotlib to a backend that only renders to files, for processes without a display
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+
+class FigureRenderer():
+    """
+    Renders the figures of a run, each name only once.
+    Without an output_dir the figures are shown. With one, they are saved there by a background process
+    using a non-interactive backend, so the simulation continues while they render.
+    """
+    def __init__(self, output_dir: str = None, max_points: int = None, method: str = "LTTB", file_format: str = "png"):
+        self.output_dir = output_dir
+        self.max_points = max_points
+        self.method = method
+        self.file_format = file_format
+        self.rendered_names = set()
+        self.executor = None # Started with the first figure
+        self.futures = {}
+
+    def plot(self, name: str, plot_function, *args):
+        """
+        Renders a figure with one of the plot functions of this module, unless a figure with this name was already rendered
+        """
+        if name in self.rendered_names:
+            return
+        self.rendered_names.add(name)
+        if self.output_dir is None:
+            plot_function(*args, max_points=self.max_points, method=self.method)
+            return
+
+        if self.executor is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            self.executor = ProcessPoolExecutor(max_workers=1, initializer=use_headless_backend)
+        output_path = os.path.join(self.output_dir, f"{name}.{self.file_format}")
+        self.futures[output_path] = self.executor.submit(plot_function, *args, max_points=self.max_points, method=self.method, output_path=output_path)
+
+    def close(self):
+        """
+        Waits for the background process to save every figure
+        """
+        if self.executor is None:
+            return
+        self.executor.shutdown(wait=True)
+        self.executor = None
+        for output_path, future in self.futures.items():
+            future.result() # Raises the error of a figure that failed to render
+            print(f"Saved figure to {output_path}")
+        self.futures = {}
+
+def renderer_from_config(visualisation_config: dict) -> FigureRenderer:
+    """
+    Builds a FigureRenderer from the visualisation section of the config
+
+    >>> renderer_from_config({"headless": True, "output_dir": "plots", "max_points": 500}).output_dir
+    'plots'
+    >>> renderer_from_config(None).output_dir is None
+    True
+    """
+    visualisation_config = visualisation_config or {}
+    output_dir = visualisation_config.get("output_dir", "figures") if visualisation_config.get("headless", False) else None
+    return FigureRenderer(output_dir, visualisation_config.get("max_points"), visualisation_config.get("downsampling", "LTTB"),
+                          visualisation_config.get("file_format", "png"))